@@ -0,0 +1,268 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# Michel Mooij, michel.mooij7@gmail.com
+
+"""
+Tool Description
+================
+This waftool records the commands of all C/C++ compile and link tasks that
+are executed during a normal build (i.e. 'waf build') and provides them to the
+waftools exporting those tasks to other build environments (e.g. the makefile,
+ninja, codeblocks and compdb waftools).
+
+For each executed task the command, the working directory, the inputs, the
+outputs and the dependencies (i.e. included headers and libraries) will be
+stored in an index ('.capture.json') in the build directory of the variant.
+When exporting, the commands of tasks that have not been changed since they
+have been executed will be taken from this index, the commands of all other
+tasks will be composed from the environment and the command template (i.e.
+run_str) of the task, without executing the compiler or linker. Hence an
+export neither requires a 'waf clean' nor a (re)build of the project and
+existing build results will be left untouched.
+
+Usage
+=====
+This waftool will be loaded automatically by the waftools using it, no changes
+to the top level wscript are required. Exporters use it as follows:
+
+	import capture
+
+	class ExportContext(Build.BuildContext):
+		fun = 'build'
+		cmd = 'export'
+
+		def execute(self):
+			capture.capture_export(self, task_process)
+
+	class ExportAllContext(Build.BuildContext):
+		fun = 'build'
+		cmd = 'export_all'
+
+		def execute(self):
+			capture.capture_export_variants(self, ExportContext)
+
+	def task_process(task):
+		# task.command_executed and task.path contain the command and its
+		# working directory
+		...
+"""
+
+import json
+from waflib import Logs, Task, TaskGen, Utils, Tools
+
+
+def options(opt):
+	pass
+
+
+def configure(conf):
+	pass
+
+
+@TaskGen.feature('c')
+@TaskGen.feature('cxx')
+def capture_build(self):
+	'''starts recording the commands of all tasks being executed during the
+	build; the commands will be stored once the build has been finished.
+	'''
+	bld = self.bld
+	if hasattr(bld, 'captured'):
+		return
+	bld.captured = {}
+	capture_install()
+	bld.add_post_fun(capture_postfun)
+
+
+def capture_install():
+	'''replaces the methods used for executing tasks by methods that record
+	the commands and the results of each task.
+	'''
+	if len(CAPTURE_METHODS):
+		return
+	CAPTURE_METHODS['exec_command'] = Task.TaskBase.exec_command
+	CAPTURE_METHODS['process'] = Task.TaskBase.process
+
+	def exec_command(self, *k, **kw):
+		ret = CAPTURE_METHODS['exec_command'](self, *k, **kw)
+		try:
+			self.command_executed = k[0]
+		except IndexError:
+			self.command_executed = ''
+		self.path = kw.get('cwd', None) or self.generator.bld.cwd
+		return ret
+	Task.TaskBase.exec_command = exec_command
+
+	def process(self):
+		CAPTURE_METHODS['process'](self)
+		capture_task(self)
+	Task.TaskBase.process = process
+
+
+def capture_uninstall():
+	'''restores the methods used for executing tasks.'''
+	if not len(CAPTURE_METHODS):
+		return
+	Task.TaskBase.exec_command = CAPTURE_METHODS.pop('exec_command')
+	Task.TaskBase.process = CAPTURE_METHODS.pop('process')
+
+
+def capture_task(task):
+	'''records the command, working directory, inputs, outputs and
+	dependencies of a C/C++ task that has been executed successfully.
+	'''
+	if task.hasrun != Task.SUCCESS or not capture_supported(task):
+		return
+	bld = task.generator.bld
+	captured = getattr(bld, 'captured', None)
+	if captured is None or not hasattr(task, 'command_executed'):
+		return
+	deps = task.dep_nodes + bld.node_deps.get(task.uid(), [])
+	captured[Utils.to_hex(task.uid())] = {
+		'name': task.generator.get_name(),
+		'sig': Utils.to_hex(getattr(task, 'cache_sig', '')),
+		'cmd': task.command_executed,
+		'cwd': str(task.path),
+		'inputs': [x.abspath() for x in task.inputs],
+		'outputs': [x.abspath() for x in task.outputs],
+		'deps': [x.abspath() for x in deps] }
+
+
+def capture_postfun(bld):
+	'''stores the recorded commands in the index and restores the methods
+	used for executing tasks.
+	'''
+	capture_uninstall()
+	if not len(bld.captured):
+		return
+	index = capture_load(bld)
+	index.update(bld.captured)
+	node = capture_node(bld)
+	node.write(json.dumps(index, indent=1, sort_keys=True))
+
+
+def capture_node(bld):
+	return bld.bldnode.make_node('.capture.json')
+
+
+def capture_load(bld):
+	'''returns the index of recorded commands.'''
+	try:
+		return json.loads(capture_node(bld).read())
+	except (OSError, IOError, ValueError):
+		return {}
+
+
+def capture_supported(task):
+	'''returns True when the task is a C/C++ compile or link task.'''
+	return isinstance(task, (Tools.c.c, Tools.cxx.cxx, Tools.ccroot.link_task))
+
+
+def capture_export(bld, process):
+	'''posts all task generators and passes each C/C++ compile and link task to
+	the process function of an exporter, without executing the build; the
+	command and working directory of each task will be taken from the index,
+	when the task has not been changed since it has been executed, or will be
+	composed otherwise.
+	'''
+	bld.captured = None
+	bld.restore()
+	if not bld.all_envs:
+		bld.load_envs()
+	bld.recurse([bld.run_dir])
+	bld.pre_build()
+
+	index = capture_load(bld)
+	(recorded, composed) = (0, 0)
+	for tasks in bld.get_build_iterator():
+		if not tasks:
+			break
+		for task in tasks:
+			if not capture_supported(task):
+				continue
+			try:
+				if capture_apply(index, task):
+					recorded += 1
+				elif capture_compose(task):
+					composed += 1
+				else:
+					continue
+			except Exception as exception:
+				bld.failure = (exception, task, getattr(task,"command_executed",[]))
+				continue
+			process(task)
+	Logs.info('export(%s): %i recorded and %i composed command(s)' % (bld.variant or 'default', recorded, composed))
+
+
+def capture_export_variants(bld, cls):
+	'''exports all configured variants, including the default one, using the
+	given export context class; the variants will be exported one after
+	another, since waf contexts share global state (e.g. the options).
+	'''
+	bld.load_envs()
+	variants = sorted(bld.all_envs.keys())
+
+	def export(variant):
+		ctx = cls()
+		ctx.options = bld.options
+		ctx.cmd = cls.cmd
+		ctx.variant = variant
+		ctx.execute()
+
+	for variant in variants:
+		export(variant)
+
+
+def capture_apply(index, task):
+	'''takes the command of the task from the index; returns False when the
+	task has not been recorded or has been changed since it has been executed.
+	'''
+	entry = index.get(Utils.to_hex(task.uid()))
+	if entry is None:
+		return False
+	try:
+		sig = Utils.to_hex(task.signature())
+	except Exception:
+		return False
+	if sig != entry['sig']:
+		return False
+	task.command_executed = entry['cmd']
+	task.path = entry['cwd']
+	return True
+
+
+def capture_compose(task):
+	'''composes the command of a task using its command template, without
+	executing it; unlike the run method of the task (e.g. the one of static
+	libraries) it will not remove existing targets.
+	'''
+	cls = task.__class__
+	if not getattr(cls, 'orig_run_str', None):
+		Logs.warn('export: no command template for %r' % task)
+		return False
+
+	bld = task.generator.bld
+	if isinstance(task, (Tools.c.c, Tools.cxx.cxx)):
+		try:
+			(nodes, names) = task.scan()
+		except Exception as exception:
+			Logs.debug('export: failed to scan %r: %r' % (task.inputs, exception))
+		else:
+			bld.node_deps[task.uid()] = nodes
+
+	def exec_command(cmd, **kw):
+		task.command_executed = cmd
+		task.path = kw.get('cwd', None) or bld.cwd
+		return 0
+	task.exec_command = exec_command
+
+	if cls not in CAPTURE_FUNS:
+		CAPTURE_FUNS[cls] = Task.compile_fun(cls.orig_run_str, cls.shell)[0]
+	CAPTURE_FUNS[cls](task)
+	return True
+
+
+CAPTURE_METHODS = {}
+
+
+CAPTURE_FUNS = {}
+
@@ -25,13 +25,40 @@ functions of the top level wscript in the waf build environment:
 	configure(conf):
 		conf.load('codeblocks')
 
+In order to export the projects issue the following command:
+	'waf codeblocks'
+Or, for all configured variants at once:
+	'waf codeblocks_all'
+
+Each variant will be added as a separate build target to the projects.
+
+A project, or workspace, file will only be written when its contents have 
+been changed; hence Code::Blocks will only reload projects that have actually 
+been changed.
+
+When a compiler launcher (e.g. ccache) has been configured using the 
+'--compiler-launcher' option it will be stored in the custom variable 
+'CC_LAUNCHER' of each build target, which can be used in the toolchain 
+executables of the compiler settings (e.g. '$(CC_LAUNCHER) gcc').
+
+Remarks
+-------
+The C/C++ tasks will be exported using the commands that have been recorded
+during the last build (see the capture waftool); commands of tasks that have
+been changed since, or have not been build yet, will be composed without
+executing the compiler or linker. Hence the build will neither be cleaned nor
+executed and existing build results will be left untouched.
+
 """
 
 import os
 import re
+import json
+import hashlib
 import xml.etree.ElementTree as ElementTree
 from xml.dom import minidom
-from waflib import Build, Scripting, Logs, Task, Tools
+import capture
+from waflib import Build, Logs, Tools
 
 
 def options(opt):
@@ -56,41 +83,26 @@ class MakefileContext(Build.BuildContext):
 		self.failure = None
 		self.components = {}
 
-		old_exec = Task.TaskBase.exec_command
-		def exec_command(self, *k, **kw):
-			ret = old_exec(self, *k, **kw)
-			try:
-				cmd = k[0]
-			except IndexError:
-				cmd = ''
-			finally:
-				self.command_executed = cmd
-			try:
-				cwd = kw['cwd']
-			except KeyError:
-				cwd = self.generator.bld.cwd
-			finally:
-				self.path = cwd
-			return ret
-		Task.TaskBase.exec_command = exec_command
-
-		old_process = Task.TaskBase.process
-		def process(self):
-			old_process(self)
-			task_process(self)
-		Task.TaskBase.process = process
-
-		def postfun(self):
-			if self.failure:
-				build_show_failure(self)
-			elif not len(self.components):
-				Logs.warn('codeblocks export failed: no C/C++ targets found')
-			else:
-				build_postfun(self)
-		super(MakefileContext, self).add_post_fun(postfun)
-
-		Scripting.run_command('clean')
-		super(MakefileContext, self).execute(*k, **kw)
+		capture.capture_export(self, task_process)
+		postfun(self)
+
+
+class CodeblocksAllContext(Build.BuildContext):
+	'''exports and converts C/C++ tasks of all variants to Code::Blocks.'''
+	fun = 'build'
+	cmd = 'codeblocks_all'
+
+	def execute(self):
+		capture.capture_export_variants(self, MakefileContext)
+
+
+def postfun(bld):
+	if bld.failure:
+		build_show_failure(bld)
+	elif not len(bld.components):
+		Logs.warn('codeblocks export failed: no C/C++ targets found')
+	else:
+		build_postfun(bld)
 
 
 def task_process(task):	
@@ -128,18 +140,25 @@ def build_postfun(bld):
 	path = "%s/codeblocks" % bld.path.abspath()
 	if not os.path.exists(path):
 		os.makedirs(path)
+	hashes = codeblocks_load_hashes(path)
 	projects = {}
 	for component in bld.components.values():
-		if component.islinked:
-			(fname, depends) = codeblocks_project(bld, path, component)
+		if not component.islinked:
+			continue
+		(fname, depends, changed) = codeblocks_project(bld, path, component, hashes)
+		if changed:
 			Logs.warn('exported: %s, dependencies: %s' % (fname,depends))
-			projects[os.path.basename(fname)] = depends
-	fname = codeblocks_workspace(path, projects)
-	Logs.warn('exported: %s' % fname)
+		else:
+			Logs.info('unchanged: %s' % fname)
+		projects[os.path.basename(fname)] = depends
+	(fname, changed) = codeblocks_workspace(path, projects, hashes)
+	if changed:
+		Logs.warn('exported: %s' % fname)
+	codeblocks_save_hashes(path, hashes)
 
 
 def codeblocks_get_compiler(bld):
-	cc = os.path.basename(bld.env.CC[0])
+	cc = os.path.basename(bld.env.CC[len(bld.env.COMPILER_LAUNCHER)])
 	dest_cpu = bld.env.DEST_CPU
 	if dest_cpu == 'arm':
 		cc = 'armelfgcc'
@@ -148,28 +167,34 @@ def codeblocks_get_compiler(bld):
 	return cc
 
 
-def codeblocks_project(bld, path, component):
+def codeblocks_unique(lst):
+	'''returns the list without duplicates, while preserving the order.'''
+	seen = set()
+	return [l for l in lst if not (l in seen or seen.add(l))]
+
+
+def codeblocks_project(bld, path, component, hashes):
 	prefix = bld.path.abspath().replace('\\','/')
 	bpath = re.sub(prefix, '..', bld.path.get_bld().abspath())
 
 	# determine compile options and include path
 	cflags = []
 	includes = []
-	for key in component.inputs:
-		obj = bld.components[key]
+	objects = [bld.components[key] for key in component.inputs if key in bld.components]
+	for obj in objects:
 		for cmd in obj.command:
 			if cmd.startswith('-I'):
 				include = re.sub(prefix, '..', cmd.lstrip('-I'))
 				includes.append(include)
 			elif cmd.startswith('-') and cmd not in ['-c','-o']:
 				cflags.append(cmd)
-	cflags = list(set(cflags))
-	includes = list(set(includes))
+	cflags = codeblocks_unique(cflags)
+	includes = codeblocks_unique(includes)
 
 	# determine link options, libs and link paths
 	lflags = [c for c in component.command if c.startswith('-Wl')]
 	lflags = [re.sub('/home/.*?/', '~/', lflag) for lflag in lflags]
-	lflags = list(set(lflags))
+	lflags = codeblocks_unique(lflags)
 	libs = []
 	libpaths = []
 	for cmd in component.command:
@@ -177,8 +202,8 @@ def codeblocks_project(bld, path, component):
 			libs.append(cmd.lstrip('-l'))
 		elif cmd.startswith('-L'):
 			libpaths.append('%s/%s' % (bpath, cmd.lstrip('-L')))
-	libs = list(set(libs))
-	libpaths = list(set(libpaths))
+	libs = codeblocks_unique(libs)
+	libpaths = codeblocks_unique(libpaths)
 	depends = list(libs)
 
 	# open existing project or create new one from template
@@ -226,6 +251,11 @@ def codeblocks_project(bld, path, component):
 		if option.get('compiler'):
 			option.set('compiler', component.compiler)
 
+	launcher = bld.env.COMPILER_LAUNCHER
+	if len(launcher):
+		environment = ElementTree.SubElement(target, 'Environment')
+		ElementTree.SubElement(environment, 'Variable', attrib={'name':'CC_LAUNCHER', 'value':' '.join(launcher)})
+
 	compiler = target.find('Compiler')
 	for cflag in cflags:
 		ElementTree.SubElement(compiler, 'Add', attrib={'option':cflag})
@@ -243,40 +273,66 @@ def codeblocks_project(bld, path, component):
 	build.append(target)
 
 	# add (new) source file(s)
-	sources = []
-	for key in component.inputs:
-		obj = bld.components[key]
+	units = set([str(unit.get('filename')).replace('\\','/') for unit in project.iter('Unit')])
+	for obj in objects:
 		for src in obj.inputs:
-			sources.append(re.sub(prefix, '..', src))
-	for unit in project.iter('Unit'):
-		src = str(unit.get('filename')).replace('\\','/')
-		while sources.count(src):
-			sources.remove(src)
-
-	for src in sources:
-		unit = ElementTree.fromstring(CODEBLOCKS_CBP_UNIT)
-		unit.set('filename', src)
-		project.append(unit)
+			src = re.sub(prefix, '..', src)
+			if src in units:
+				continue
+			units.add(src)
+			unit = ElementTree.fromstring(CODEBLOCKS_CBP_UNIT)
+			unit.set('filename', src)
+			project.append(unit)
 
 	if project.find('Extensions') is None:
 		extension = ElementTree.fromstring(CODEBLOCKS_CBP_EXTENSION)
 		project.append(extension)
 
 	# prettify and export project data
-	codeblocks_save(fname, root)
-	return (fname, depends)
+	changed = codeblocks_save(fname, root, hashes)
+	return (fname, depends, changed)
 
 
-def codeblocks_save(fname, root):
+def codeblocks_save(fname, root, hashes):
+	'''prettifies and saves the project or workspace, returns False when the
+	file has not been changed. The hash of the project data will be stored, 
+	avoiding prettifying unchanged projects when exporting again.
+	'''
 	s = ElementTree.tostring(root)
+	key = hashlib.md5(s).hexdigest()
+	name = os.path.basename(fname)
+	if hashes.get(name) == key and os.path.exists(fname):
+		return False
+
 	content = minidom.parseString(s).toprettyxml(indent="\t")
 	lines = [l for l in content.splitlines() if not l.isspace() and len(l)]
 	lines[0] = '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>'
+	content = '\n'.join(lines)
+	hashes[name] = key
+	if os.path.exists(fname):
+		with open(fname, 'r') as f:
+			if f.read() == content:
+				return False
 	with open(fname, 'w') as f:
-		f.write('\n'.join(lines))
+		f.write(content)
+	return True
+
 
+def codeblocks_load_hashes(path):
+	'''returns the hashes of the projects and workspace saved previously.'''
+	try:
+		with open(os.path.join(path, '.codeblocks.json'), 'r') as f:
+			return json.load(f)
+	except (OSError, IOError, ValueError):
+		return {}
 
-def codeblocks_workspace(path, projects):
+
+def codeblocks_save_hashes(path, hashes):
+	with open(os.path.join(path, '.codeblocks.json'), 'w') as f:
+		json.dump(hashes, f, indent=1, sort_keys=True)
+
+
+def codeblocks_workspace(path, projects, hashes):
 	# open existing workspace or create a new one from template
 	fname = '%s/codeblocks.workspace' % path
 	if os.path.exists(fname):
@@ -289,22 +345,22 @@ def codeblocks_workspace(path, projects):
 	for project in workspace.iter('Project'):
 		name = project.get('filename')
 		if projects.has_key(name):
-			depends = projects[name]
-			for depend in project.iter('Depends'):
-				dep = str(depend.get('filename'))
-				depends.remove(dep)
+			existing = set([str(depend.get('filename')) for depend in project.iter('Depends')])
+			depends = [depend for depend in projects[name] if depend not in existing]
 			for depend in depends:
 				ElementTree.SubElement(project, 'Depends', attrib={'filename':depend})
 			del projects[name]
 
 	# add new projects including its dependencies
-	for name, depends in projects.items():
+	for name, depends in sorted(projects.items()):
 		project = ElementTree.SubElement(workspace, 'Project', attrib={'filename':name})
 		if len(depends):
 			for depend in depends:
 				ElementTree.SubElement(project, 'Depends', attrib={'filename':depend})
-	codeblocks_save(fname, root)
-	return fname
+	changed = codeblocks_save(fname, root, hashes)
+	return (fname, changed)
+
+
 
 
 CODEBLOCKS_CBP_PROJECT = '''
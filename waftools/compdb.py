@@ -0,0 +1,143 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# Michel Mooij, michel.mooij7@gmail.com
+
+"""
+Tool Description
+================
+This waftool can be used for the export of all C/C++ compile tasks defined
+within a waf project into a JSON compilation database (i.e.
+compile_commands.json) as used by clang based tools, editors and by cppcheck.
+
+Each entry in the compilation database contains the exact command, including
+all compiler flags, defines and include paths, as executed by waf when
+compiling a C/C++ source file.
+
+The compilation database of the native environment will be stored as
+'compile_commands.json' in the top level directory of the waf build
+environment, those of variants will be stored as 'compile_commands.json' in
+the build directory of the variant.
+
+Remarks
+-------
+The C/C++ tasks will be exported using the commands that have been recorded
+during the last build (see the capture waftool); commands of tasks that have
+been changed since, or have not been build yet, will be composed without
+executing the compiler or linker. Hence the build will neither be cleaned nor
+executed and existing build results will be left untouched.
+
+Usage
+=====
+In order to use this tool add the following to the 'options' and 'configure'
+functions of the top level wscript in the waf build environment:
+
+	options(opt):
+		opt.load('compdb')
+
+	configure(conf):
+		conf.load('compdb')
+
+In order to generate the compilation database issue the following command:
+	'waf compdb'
+Or
+	'waf compdb_<variant>'
+Or, for all configured variants at once:
+	'waf compdb_all'
+
+Assuming of course a variant command has been created in the same way as for
+the makefile waftool.
+
+The cppcheck waftool can use the exported compilation database, instead of
+composing the include paths itself, using:
+	'waf build --cppcheck-compdb=compile_commands.json'
+"""
+
+import os
+import json
+import capture
+from waflib import Build, Logs, Tools
+
+
+def options(opt):
+	pass
+
+
+def configure(conf):
+	pass
+
+
+class CompdbContext(Build.BuildContext):
+	'''exports C/C++ compile tasks to compile_commands.json.'''
+	fun = 'build'
+	cmd = 'compdb'
+
+	def execute(self, *k, **kw):
+		self.failure = None
+		self.entries = []
+
+		capture.capture_export(self, task_process)
+		postfun(self)
+
+
+class CompdbAllContext(Build.BuildContext):
+	'''exports and converts C/C++ tasks of all variants to compile_commands.json.'''
+	fun = 'build'
+	cmd = 'compdb_all'
+
+	def execute(self):
+		capture.capture_export_variants(self, CompdbContext)
+
+
+def postfun(bld):
+	if bld.failure:
+		build_show_failure(bld)
+	elif not len(bld.entries):
+		Logs.warn('compdb export failed: no C/C++ targets found')
+	else:
+		build_postfun(bld)
+
+
+def task_process(task):
+	'''converts a compile task into a compilation database entry.'''
+	if not isinstance(task, Tools.c.c) and not isinstance(task, Tools.cxx.cxx):
+		return
+
+	bld = task.generator.bld
+	try:
+		cmd = task.command_executed
+		if isinstance(cmd, list):
+			arguments = [str(c) for c in cmd]
+		else:
+			arguments = str(cmd).split()
+		launcher = [str(l) for l in task.env.COMPILER_LAUNCHER]
+		if len(launcher) and arguments[:len(launcher)] == launcher:
+			arguments = arguments[len(launcher):]
+		entry = {}
+		entry['directory'] = os.path.abspath(str(task.path))
+		entry['arguments'] = arguments
+		entry['file'] = task.inputs[0].abspath()
+		entry['output'] = task.outputs[0].abspath()
+	except Exception as exception:
+		bld.failure = (exception, task, getattr(task,"command_executed",[]))
+	else:
+		bld.entries.append(entry)
+
+
+def build_show_failure(bld):
+	(err, tsk, cmd) = bld.failure
+	msg = "export failure:\n"
+	msg += " tsk='%s'\n" % (str(tsk).replace('\n',''))
+	msg += " err='%r'\n" % (err)
+	msg += " cmd='%s'\n" % ('\n     '.join(cmd))
+	bld.fatal(msg)
+
+
+def build_postfun(bld):
+	entries = sorted(bld.entries, key=lambda e: e['file'])
+	if bld.variant:
+		node = bld.srcnode.get_bld().make_node('compile_commands.json')
+	else:
+		node = bld.path.make_node('compile_commands.json')
+	node.write(json.dumps(entries, indent=2))
+	Logs.warn('exported: %s' % node.abspath())
+
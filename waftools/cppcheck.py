@@ -40,8 +40,10 @@ building the task.
 	def build(bld):
 		bld.program(name='foo', src='foobar.c')
 
-The result of the source code analysis will be stored both as xml and html 
-files in the build location for the task. Should any error be detected by 
+The result of the source code analysis will be stored as xml file in the build
+location for the task. Once the build has been finished a single html report, 
+containing the results of all tasks, will be created in the 'cppcheck' 
+directory of the top level build location. Should any error be detected by 
 cppcheck the build will be aborted and a link to the html report will be shown.
 
 When needed source code checking by cppcheck can be disabled per task, per 
@@ -70,6 +72,116 @@ file can be added to the build task as shown in the example below:
 
 A cppcheck suppress file should contain one suppress rule per line. Each of 
 these rules will be passed as an '--suppress=<rule>' argument to cppcheck.
+Rules are formatted as '<id>[:<file>[:<line>]]', where file names are relative
+to the location of the build task. The rules are also stored in the defect 
+store (see below), where they are applied to the results of the whole program
+checks as well.
+
+Defect store and baseline
+-------------------------
+All defects are kept in a sqlite database ('.cppcheck/defects.db' in the build
+location), where each defect is identified using its file, id and a hash of 
+the (normalized) source line in which it has been detected. When using the
+'--cppcheck-baseline' option all current defects will be recorded as baseline.
+Builds using the '--cppcheck-new-only' option will only report, and fail on, 
+defects that are not part of this baseline:
+
+	'waf build --cppcheck-baseline'
+	'waf build --cppcheck-new-only'
+
+Result cache
+------------
+The results of each cppcheck analysis are stored in a persistent cache. The 
+key of each cache entry is a hash of the cppcheck version, the cppcheck command
+line, the compilation database (if any), the contents of the source files 
+being checked and the contents of all (project) header files included by those
+sources. When none of these have been changed since a previous run the stored
+results will be used and cppcheck will not be executed at all.
+
+By default the cache is located in '.cppcheck/cache' in the build directory,
+another location can be selected using the '--cppcheck-cache-dir' option. The 
+cache can be disabled using the '--cppcheck-no-cache' option.
+
+Within a build directory the cppcheck tasks also take part in the normal waf
+dependency tracking; the source files are the inputs of a cppcheck task, the
+headers they include are found using the waf C preprocessor and the 
+'cppcheck.xml' report is its output. Hence only
+task generators of which the sources, headers or cppcheck options have been 
+changed will be checked again.
+
+Granularity
+-----------
+By default all sources of a task generator are checked using a single cppcheck
+task. When using the '--cppcheck-granularity=file' option a cppcheck task will
+be created for each source file instead, allowing the analysis to be spread 
+across all available jobs. The results of these tasks will be merged into the 
+same xml report that is created when checking per task generator.
+
+Resource usage
+--------------
+cppcheck may use large amounts of memory when checking many preprocessor
+configurations. The '--cppcheck-jobs=<n>' option limits the number of cppcheck
+analyses that will be executed concurrently, without limiting the number of 
+other (e.g. compile) tasks. When using the '--cppcheck-timeout=<seconds>' 
+option an analysis exceeding the timeout will be aborted and retried using half
+the number of preprocessor configurations (--max-configs), until only a single
+configuration remains. Such partial results will be reported but will neither 
+be cached nor be considered up to date; they will be checked again during the
+next build.
+
+Statistics
+----------
+For each cppcheck analysis the wall time, the peak memory usage (RSS), the
+files analyzed and the number of preprocessor configurations tried for each 
+file will be recorded. Once the build has been finished a summary of the task
+generators and files that took the most time will be shown and all statistics
+will be written to '.cppcheck/stats.json' in the build location of the 
+variant. The number of entries shown can be changed using the
+'--cppcheck-stats=<n>' option; use '--cppcheck-stats=0' to hide the summary.
+
+Deferred reports
+----------------
+Creating the html report takes time and is not always needed, e.g. when 
+building on a build server. When using the '--cppcheck-report=deferred' option
+only the (xml) results will be stored during the build. The html report can be
+created afterwards, from the stored results, using:
+
+	'waf cppcheck_report'
+
+Highlighted source files in the html report are stored using the hash of their
+contents and defects; only new or changed files will be rendered, in parallel
+using a pool of worker processes.
+
+Compilation database
+--------------------
+Instead of passing the include paths of each task generator, cppcheck can use
+the compilation database (i.e. compile_commands.json) of the project, which 
+contains the exact compiler flags, defines and include paths used for each 
+source file. The compilation database can be exported using the 'compdb' 
+waftool, and used when checking using the '--cppcheck-compdb' option:
+
+	'waf compdb'
+	'waf build --cppcheck-compdb=compile_commands.json'
+
+Whole program analysis
+----------------------
+cppcheck stores the analysis information of each checked source file in a 
+build directory (i.e. '.cppcheck/build' in the build location of the variant),
+using it to only analyze sources that have been changed when checking again. 
+Once all sources have been checked the whole program checks, which can only be
+performed reliably on all sources at once, will be performed for the project 
+as a whole. By default only the 'unusedFunction' check will be performed, 
+other checks can be selected using the '--cppcheck-project-enable' option. 
+Use '--cppcheck-project-enable=' to disable the whole program checks. The 
+results will be added to the html report as 'whole-program'; only defects that
+can only be detected by the whole program checks (e.g. unusedFunction and the
+ctu checks) will be reported, all other defects have already been reported 
+for the target in which they have been found.
+
+The whole program checks will only be performed when the command line, the
+checked sources or the (project) headers included by those sources have been
+changed since the previous build; their results are stored in the result
+cache as well.
 
 Dependencies
 ================
@@ -84,9 +196,19 @@ script that comes shipped with the cppcheck tool.
 """
 
 import os
+import re
 import sys
+import time
+import json
+import shlex
+import shutil
+import threading
+import multiprocessing
+import sqlite3
+import fnmatch
 import xml.etree.ElementTree as ElementTree
-from waflib import Task, TaskGen, Logs, Context
+from waflib import Build, Context, Task, TaskGen, Logs, Utils, Errors
+from waflib.Tools import c_preproc
 
 PYGMENTS_EXC_MSG= '''
 The required module 'pygments' could not be found. Please install it using your 
@@ -112,13 +234,17 @@ def options(opt):
 		help='continue in case of errors (default=False)')
 
 	opt.add_option('--cppcheck-bin-enable', dest='cppcheck_bin_enable', 
-		default='warning,performance,portability,style,unusedFunction', action='store',
-		help="cppcheck option '--enable=' for binaries (default=warning,performance,portability,style,unusedFunction)")
+		default='warning,performance,portability,style', action='store',
+		help="cppcheck option '--enable=' for binaries (default=warning,performance,portability,style)")
 
 	opt.add_option('--cppcheck-lib-enable', dest='cppcheck_lib_enable', 
 		default='warning,performance,portability,style', action='store', 
 		help="cppcheck option '--enable=' for libraries (default=warning,performance,portability,style)")
 
+	opt.add_option('--cppcheck-project-enable', dest='cppcheck_project_enable', 
+		default='unusedFunction', action='store', 
+		help="cppcheck option '--enable=' for whole program checks on all sources, empty to disable (default=unusedFunction)")
+
 	opt.add_option('--cppcheck-std-c', dest='cppcheck_std_c',
 		default='c99', action='store', 
 		help='cppcheck standard to use when checking C (default=c99)')
@@ -135,6 +261,50 @@ def options(opt):
 		default='20', action='store', 
 		help='maximum preprocessor (--max-configs) define iterations (default=20)')
 
+	opt.add_option('--cppcheck-jobs', dest='cppcheck_jobs',
+		default=0, action='store', type='int',
+		help='maximum number of concurrent cppcheck analyses, 0 for no limit (default=0)')
+
+	opt.add_option('--cppcheck-timeout', dest='cppcheck_timeout',
+		default=0, action='store', type='int',
+		help='seconds after which an analysis is retried using less --max-configs, 0 for no timeout (default=0)')
+
+	opt.add_option('--cppcheck-stats', dest='cppcheck_stats',
+		default=10, action='store', type='int',
+		help='number of slowest task generators and files shown after the build (default=10)')
+
+	opt.add_option('--cppcheck-granularity', dest='cppcheck_granularity',
+		default='tgen', action='store', choices=['tgen', 'file'],
+		help='create a cppcheck task per task generator or per source file (default=tgen)')
+
+	opt.add_option('--cppcheck-report', dest='cppcheck_report',
+		default='build', action='store', choices=['build', 'deferred'],
+		help="create the html report during the build or defer it to 'waf cppcheck_report' (default=build)")
+
+	opt.add_option('--cppcheck-no-cache', dest='cppcheck_no_cache',
+		default=False, action='store_true',
+		help='do not use cached cppcheck results (default=False)')
+
+	opt.add_option('--cppcheck-cache-dir', dest='cppcheck_cache_dir',
+		default='', action='store',
+		help='location of the cppcheck result cache (default=<out>/.cppcheck/cache)')
+
+	opt.add_option('--cppcheck-compdb', dest='cppcheck_compdb',
+		default='', action='store',
+		help="use the given compile_commands.json (see 'waf compdb') instead of include paths (default='')")
+
+	opt.add_option('--cppcheck-baseline', dest='cppcheck_baseline',
+		default=False, action='store_true',
+		help='record all current defects as baseline (default=False)')
+
+	opt.add_option('--cppcheck-new-only', dest='cppcheck_new_only',
+		default=False, action='store_true',
+		help='only report and evaluate defects that are not part of the baseline (default=False)')
+
+	opt.add_option('--cppcheck-no-build-dir', dest='cppcheck_no_build_dir',
+		default=False, action='store_true',
+		help="do not pass '--cppcheck-build-dir' to cppcheck (default=False)")
+
 
 def configure(conf):
 	if conf.options.cppcheck_skip:
@@ -144,7 +314,9 @@ def configure(conf):
 	conf.env.CPPCHECK_MAX_CONFIGS = conf.options.cppcheck_max_configs
 	conf.env.CPPCHECK_BIN_ENABLE = conf.options.cppcheck_bin_enable
 	conf.env.CPPCHECK_LIB_ENABLE = conf.options.cppcheck_lib_enable
+	conf.env.CPPCHECK_PROJECT_ENABLE = conf.options.cppcheck_project_enable
 	conf.find_program('cppcheck', var='CPPCHECK')
+	conf.env.CPPCHECK_VERSION = conf.cmd_and_log('%s --version' % conf.env.CPPCHECK).strip()
 
 
 @TaskGen.feature('c')
@@ -154,14 +326,299 @@ def cppcheck_execute(self):
 		return
 	if getattr(self, 'cppcheck_skip', False):
 		return
-	task = self.create_task('cppcheck')
-	task.cmd = _tgen_create_cmd(self)
-	task.fatal = []
+	fatal = []
 	if not self.bld.options.cppcheck_err_resume:
-		task.fatal.append('error')
+		fatal.append('error')
+
+	bld = self.path.get_bld()
+	sources = self.to_nodes(getattr(self, 'source', []))
+	report = [bld.find_or_declare('cppcheck.xml')]
+
+	if self.bld.options.cppcheck_granularity == 'file':
+		partials = []
+		cmds = []
+		tasks = []
+		for i, src in enumerate(sources):
+			partial = bld.find_or_declare('cppcheck/%s.%i.xml' % (src.name, i))
+			task = self.create_task('cppcheck', src=[src], tgt=[partial])
+			task.build_dir = _tgen_build_dir(self, '%s.%i' % (src.name, i))
+			task.cmd = _tgen_create_cmd(self, [src], task.build_dir)
+			task.partial = partial
+			tasks.append(task)
+			partials.append(partial)
+			cmds.append(task.cmd)
+		merge = self.create_task('cppcheck_merge', src=partials, tgt=report)
+		merge.cmd = '\n'.join(cmds)
+	else:
+		task = self.create_task('cppcheck', src=sources, tgt=report)
+		task.build_dir = _tgen_build_dir(self)
+		task.cmd = _tgen_create_cmd(self, sources, task.build_dir)
+		tasks = [task]
+
+	if not hasattr(self.bld, 'cppcheck_results'):
+		self.bld.cppcheck_results = []
+		self.bld.cppcheck_project = ([], [])
+		self.bld.cppcheck_tasks = []
+		self.bld.cppcheck_stats = []
+		self.bld.add_post_fun(cppcheck_postfun)
+	self.bld.cppcheck_tasks.extend(tasks)
+	self.bld.cppcheck_results.append((self.get_name(), report[0], fatal, _tgen_suppressions(self)))
+
+	(srcs, incs) = self.bld.cppcheck_project
+	srcs.extend([src for src in sources if src not in srcs])
+	incs.extend([inc for inc in _tgen_includes(self) if inc not in incs])
+
+
+class CppcheckReportContext(Build.BuildContext):
+	'''creates the cppcheck html report from the stored xml results.'''
+	cmd = 'cppcheck_report'
+	fun = 'build'
+
+	def execute(self):
+		self.restore()
+		if not self.all_envs:
+			self.load_envs()
+		self.recurse([self.run_dir])
+
+		results = []
+		for group in self.groups:
+			for tgen in group:
+				if not isinstance(tgen, TaskGen.task_gen):
+					continue
+				if not set(['c', 'cxx']) & set(Utils.to_list(getattr(tgen, 'features', []))):
+					continue
+				if getattr(tgen, 'cppcheck_skip', False):
+					continue
+				name = tgen.get_name()
+				xml = tgen.path.get_bld().find_node('cppcheck.xml')
+				if xml is None:
+					Logs.warn("cppcheck: no results found for '%s', build it first" % name)
+					continue
+				results.append((name, xml, [], _tgen_suppressions(tgen)))
+
+		xml = _bld_project_xml(self)
+		if os.path.exists(xml.abspath()):
+			results.append((CPPCHECK_PROJECT, xml, [], []))
+		results = _bld_store_results(self, results)
+		index = CppcheckHtmlReport(self).create([(r[0], r[3]) for r in results])
+		Logs.info("cppcheck report: file://%r" % index)
+
+
+def cppcheck_postfun(bld):
+	'''creates the project wide html report (unless deferred) for, and 
+	evaluates the results of, all task generators that have been checked.
+	'''
+	results = list(bld.cppcheck_results)
+	xml = _bld_project_check(bld)
+	if xml is not None:
+		fatal = [] if bld.options.cppcheck_err_resume else ['error']
+		results.append((CPPCHECK_PROJECT, xml, fatal, []))
+	_bld_report_stats(bld)
+	results = _bld_store_results(bld, results)
+
+	index = None
+	if bld.options.cppcheck_report != 'deferred':
+		index = CppcheckHtmlReport(bld).create([(r[0], r[3]) for r in results])
+	_errors_evaluate(bld, results, index)
+
+
+def _bld_store_results(bld, results):
+	'''stores the defects of a list of (name, xml, fatal, suppressions) results
+	in the defect store and returns a list of (name, xml, fatal, defects) 
+	containing all defects that have not been suppressed or, when using the 
+	'--cppcheck-new-only' option, only those that are not part of the baseline.
+	'''
+	store = CppcheckDefectStore(bld)
+	try:
+		lst = []
+		for (name, xml, fatal, suppressions) in results:
+			defects = store.update(name, _read_defects(xml), suppressions)
+			lst.append((name, xml, fatal, defects))
+
+		if bld.options.cppcheck_baseline:
+			store.record_baseline()
+			Logs.info('cppcheck: recorded the current defects as baseline')
+		if bld.options.cppcheck_new_only:
+			lst = [(name, xml, fatal, store.new(defects)) for (name, xml, fatal, defects) in lst]
+	finally:
+		store.close()
+	return lst
+
+
+def _bld_project_check(bld):
+	'''performs the whole program checks (e.g. unusedFunction) on all sources 
+	that have been checked during the build; cppcheck will only analyze the 
+	sources that have been changed since the previous build, using the 
+	analysis information stored in its build directory. The checks will be
+	skipped when neither the command line, the sources nor their headers have
+	been changed since the previous check, or when results for them are
+	available in the result cache. Returns the node of the xml results.
+	'''
+	enable = bld.env.CPPCHECK_PROJECT_ENABLE
+	(sources, includes) = bld.cppcheck_project
+	if not enable or not len(sources):
+		return None
+
+	path = bld.srcnode.get_bld().make_node('.cppcheck')
+	path.mkdir()
+	files = path.make_node('project.files')
+	files.write('\n'.join([src.abspath() for src in sources]))
+
+	cmd  = '%s' % bld.env.CPPCHECK
+	args = ['--inconclusive','--report-progress','--verbose','--xml','--xml-version=2']
+	args.append('--max-configs=%s' % bld.env.CPPCHECK_MAX_CONFIGS)
+	args.append('--std=%s' % bld.env.CPPCHECK_STD_C)
+	args.append('--std=%s' % bld.env.CPPCHECK_STD_CXX)
+	args.append('--enable=%s' % enable)
+	if not bld.options.cppcheck_no_build_dir:
+		build_dir = path.make_node('build/%s' % CPPCHECK_PROJECT)
+		build_dir.mkdir()
+		args.append('--cppcheck-build-dir=%r' % build_dir)
+	compdb = _bld_compdb(bld)
+	if compdb is None:
+		args.append('--file-list=%r' % files)
+		for inc in includes:
+			args.append('-I%r' % inc)
+	else:
+		args.append('--project=%r' % compdb)
+		for src in sources:
+			args.append('--file-filter=%r' % src)
+	cmd = '%s %s' % (cmd, ' '.join(args))
+
+	xml = _bld_project_xml(bld)
+	key = _bld_project_key(bld, cmd, sources)
+	sig = path.make_node('project.sig')
+	stats = {'name': CPPCHECK_PROJECT, 'cached': True, 'time': 0, 'rss': 0, 'retries': 0, 'files': []}
+	try:
+		unchanged = os.path.exists(xml.abspath()) and sig.read() == key
+	except (OSError, IOError):
+		unchanged = False
+	if unchanged:
+		bld.cppcheck_stats.append(stats)
+		return xml
+
+	cache = _bld_cache_dir(bld)
+	cached = None if cache is None else cache.make_node('%s.xml' % key)
+	if cached is not None and os.path.exists(cached.abspath()):
+		shutil.copyfile(cached.abspath(), xml.abspath())
+	else:
+		def process(stream):
+			with open(xml.abspath(), 'wb') as f:
+				report = CppcheckXmlReport(f, cmd, ids=CPPCHECK_PROJECT_IDS)
+				report.add(stream)
+				report.close()
+		Logs.info('cppcheck: whole program checks (%s)' % enable)
+		stats = _cppcheck_execute(cmd, process)
+		stats['name'] = CPPCHECK_PROJECT
+		if cached is not None:
+			_bld_cache_store(xml, cached)
+	bld.cppcheck_stats.append(stats)
+	sig.write(key)
+	return xml
+
+
+def _bld_project_key(bld, cmd, sources):
+	'''returns the hash of all inputs that influence the results of the whole
+	program checks; i.e. the cppcheck version, the command line, the
+	compilation database, the sources and all (project) headers included by
+	those sources.
+	'''
+	headers = []
+	for task in bld.cppcheck_tasks:
+		headers.extend([n for n in bld.node_deps.get(task.uid(), []) if n not in headers])
+	lst = [str(bld.env.CPPCHECK_VERSION), str(cmd), _bld_compdb_sig(bld)]
+	for node in list(sources) + headers:
+		lst.append(node.abspath())
+		lst.append(Utils.h_file(node.abspath()))
+	return Utils.to_hex(Utils.h_list(lst))
+
+
+def _bld_cache_store(node, cached):
+	'''stores a copy of the results in the result cache.'''
+	try:
+		cached.parent.mkdir()
+		tmp = '%s.%i.tmp' % (cached.abspath(), os.getpid())
+		shutil.copyfile(node.abspath(), tmp)
+		os.rename(tmp, cached.abspath())
+	except (OSError, IOError) as e:
+		Logs.warn('cppcheck: failed to cache results for %r: %r' % (CPPCHECK_PROJECT, e))
+
+
+def _bld_report_stats(bld):
+	'''writes the statistics of all cppcheck analyses to '.cppcheck/stats.json'
+	and shows the task generators and files that took the most time.
+	'''
+	tgens = {}
+	files = []
+	for stats in bld.cppcheck_stats:
+		name = stats['name']
+		if name not in tgens:
+			tgens[name] = {'name': name, 'time': 0.0, 'rss': 0, 'files': 0, 'configs': 0, 'tasks': 0, 'cached': 0, 'retries': 0}
+		tgen = tgens[name]
+		tgen['tasks'] += 1
+		if stats['cached']:
+			tgen['cached'] += 1
+			continue
+		tgen['time'] += stats['time']
+		tgen['rss'] = max(tgen['rss'], stats['rss'])
+		tgen['retries'] += stats['retries']
+		for f in stats['files']:
+			tgen['files'] += 1
+			tgen['configs'] += f['configs']
+			files.append(dict(f, name=name))
+
+	tgens = sorted(tgens.values(), key=lambda t: t['time'], reverse=True)
+	files = sorted(files, key=lambda f: f['time'], reverse=True)
+	node = bld.srcnode.get_bld().make_node('.cppcheck/stats.json')
+	node.parent.mkdir()
+	node.write(json.dumps({'tgens': tgens, 'files': files}, indent=2))
+
+	n = bld.options.cppcheck_stats
+	if n <= 0 or not len(files):
+		return
+	msg  = '\ncppcheck statistics (see %r):' % node
+	msg += '\n    %-32s %9s %9s %6s %8s' % ('task', 'time [s]', 'rss [MB]', 'files', 'configs')
+	for t in tgens[:n]:
+		msg += '\n    %-32s %9.1f %9.1f %6i %8i' % (t['name'], t['time'], t['rss'] / 1024.0, t['files'], t['configs'])
+	msg += '\n    %-32s %9s %9s %8s' % ('file', 'time [s]', '', 'configs')
+	for f in files[:n]:
+		msg += '\n    %-32s %9.1f %9s %8i' % (os.path.basename(f['file']), f['time'], '', f['configs'])
+	Logs.info(msg)
+
+
+def _bld_project_xml(bld):
+	return bld.srcnode.get_bld().make_node('.cppcheck/project.xml')
+
+
+def _errors_evaluate(bld, results, http_index):
+	fatals = []
+	for (name, xml, fatal, errors) in results:
+		if http_index is None:
+			report = 'file://%r' % xml
+		else:
+			report = 'file://%r#%s' % (http_index, name)
+		severity = [err['severity'] for err in errors]
+		problems = [err for err in errors if err['severity'] != 'information']
+
+		if set(fatal) & set(severity):
+			fatals.append((name, report))
+
+		elif len(problems):
+			msg =  "\nccpcheck detected (possible) problem(s) in task '%s', see report for details:" % name
+			msg += "\n    %s" % report
+			msg += "\n"
+			Logs.error(msg)
+
+	if len(fatals):
+		exc  = "\n"
+		for (name, report) in fatals:
+			exc += "\nccpcheck detected fatal error(s) in task '%s', see report for details:" % name
+			exc += "\n    %s" % report
+		exc += "\n"
+		bld.fatal(exc)
 
 
-def _tgen_create_cmd(self):
+def _tgen_create_cmd(self, sources=None, build_dir=None):
 	features = getattr(self, 'features', [])
 	std_c = self.env.CPPCHECK_STD_C
 	std_cxx = self.env.CPPCHECK_STD_CXX
@@ -173,11 +630,14 @@ def _tgen_create_cmd(self):
 	args = ['--inconclusive','--report-progress','--verbose','--xml','--xml-version=2']
 	args.append('--max-configs=%s' % max_configs)
 
+	compdb = _bld_compdb(self.bld)
 	if 'cxx' in features:
-		args.append('--language=c++')
+		if compdb is None:
+			args.append('--language=c++')
 		args.append('--std=%s' % std_cxx)
 	else:
-		args.append('--language=c')
+		if compdb is None:
+			args.append('--language=c')
 		args.append('--std=%s' % std_c)
 
 	if self.bld.options.cppcheck_check_config:
@@ -188,205 +648,841 @@ def _tgen_create_cmd(self):
 	else:
 		args.append('--enable=%s' % lib_enable)
 
-	for src in self.to_list(getattr(self, 'source', [])):
-		args.append('%r' % src)
-	for inc in self.to_incnodes(self.to_list(getattr(self, 'includes', []))):
-		args.append('-I%r' % inc)
-	for inc in self.to_incnodes(self.to_list(self.env.INCLUDES)):
-		args.append('-I%r' % inc)
+	if build_dir is not None:
+		args.append('--cppcheck-build-dir=%r' % build_dir)
+
+	for (id, f, line) in _tgen_suppressions(self):
+		rule = ':'.join([str(r) for r in (id, f, line) if r is not None])
+		args.append('--suppress=%r' % rule)
+
+	if sources is None:
+		sources = self.to_nodes(getattr(self, 'source', []))
+	if compdb is None:
+		for src in sources:
+			args.append('%r' % src)
+		for inc in _tgen_includes(self):
+			args.append('-I%r' % inc)
+	else:
+		# nodes, i.e. absolute paths matching those in the compilation database
+		args.append('--project=%r' % compdb)
+		for src in sources:
+			args.append('--file-filter=%r' % src)
 	return '%s %s' % (cmd, ' '.join(args))
 
 
+def _bld_compdb(bld):
+	'''returns the absolute path of the compilation database to be used by 
+	cppcheck, or None when include paths should be passed to cppcheck instead.
+	'''
+	path = bld.options.cppcheck_compdb
+	if not path:
+		return None
+	return os.path.abspath(os.path.join(bld.srcnode.abspath(), os.path.expanduser(path)))
+
+
+def _bld_compdb_sig(bld):
+	'''returns the hash of the compilation database used by cppcheck, since it
+	contains the flags, defines and include paths used for the analysis.
+	'''
+	if not hasattr(bld, 'cppcheck_compdb_sig'):
+		compdb = _bld_compdb(bld)
+		try:
+			bld.cppcheck_compdb_sig = '' if compdb is None else Utils.h_file(compdb)
+		except (OSError, IOError):
+			bld.cppcheck_compdb_sig = ''
+	return bld.cppcheck_compdb_sig
+
+
+def _tgen_suppressions(self):
+	'''returns the suppression rules, as (id, file, line) tuples, from the file
+	defined by the 'cppcheck_suppress' attribute of the task generator. File 
+	names are relative to the location of the task generator.
+	'''
+	name = getattr(self, 'cppcheck_suppress', None)
+	if not name:
+		return []
+	node = self.path.find_resource(name)
+	if node is None:
+		self.bld.fatal("cppcheck suppress file '%s' not found in '%s'" % (name, self.path.abspath()))
+
+	rules = []
+	for rule in node.read().splitlines():
+		rule = rule.strip()
+		if not len(rule) or rule.startswith('#'):
+			continue
+		lst = rule.split(':')
+		id = lst[0]
+		f = lst[1] if len(lst) > 1 and len(lst[1]) else None
+		if f is not None:
+			f = os.path.join(self.path.abspath(), f)
+		line = int(lst[2]) if len(lst) > 2 and len(lst[2]) else None
+		rules.append((id, f, line))
+	return rules
+
+
+def _tgen_includes(self):
+	'''returns the include path nodes of the task generator.'''
+	incs = self.to_incnodes(self.to_list(getattr(self, 'includes', [])))
+	incs += self.to_incnodes(self.to_list(self.env.INCLUDES))
+	return incs
+
+
+def _tgen_build_dir(self, *k):
+	'''returns the node of the (per variant) directory in which cppcheck will 
+	keep its analysis information for the task generator, or None when not
+	using a cppcheck build directory.
+	'''
+	if self.bld.options.cppcheck_no_build_dir:
+		return None
+	lst = ['.cppcheck', 'build', self.get_name()] + list(k)
+	return self.bld.srcnode.get_bld().make_node(lst)
+
+
+def _tgen_cache_dir(self):
+	'''returns the node of the directory in which cppcheck results will be 
+	cached, or None when caching has been disabled.
+	'''
+	return _bld_cache_dir(self.bld)
+
+
+def _bld_cache_dir(bld):
+	if bld.options.cppcheck_no_cache:
+		return None
+	path = bld.options.cppcheck_cache_dir
+	if path:
+		return bld.root.make_node(os.path.abspath(os.path.expanduser(path)))
+	return bld.srcnode.get_bld().make_node('.cppcheck/cache')
+
+
 class cppcheck(Task.Task):
 	quiet = True
+	running = 0
+	lock = threading.Lock()
+
+	def runnable_status(self):
+		'''postpones the task while the maximum number of concurrent cppcheck
+		analyses (--cppcheck-jobs) are running, without limiting the number of
+		other (e.g. compile) tasks that can be executed concurrently.
+		'''
+		ret = super(cppcheck, self).runnable_status()
+		jobs = self.generator.bld.options.cppcheck_jobs
+		if ret != Task.RUN_ME or jobs <= 0:
+			return ret
+		with cppcheck.lock:
+			if cppcheck.running >= jobs:
+				return Task.ASK_LATER
+			cppcheck.running += 1
+			self.slot = True
+		return ret
+
+	def scan(self):
+		'''uses the waf C preprocessor to find the (project) headers included 
+		by the sources being checked.
+		'''
+		incn = getattr(self.generator, 'includes_nodes', [])
+		if c_preproc.go_absolute:
+			nodepaths = incn + [self.generator.bld.root.find_dir(x) for x in c_preproc.standard_includes]
+		else:
+			nodepaths = [x for x in incn if x.is_child_of(x.ctx.srcnode) or x.is_child_of(x.ctx.bldnode)]
+
+		nodes = []
+		names = []
+		for src in self.inputs:
+			parser = c_preproc.c_parser(nodepaths)
+			parser.start(src, self.env)
+			nodes.extend([n for n in parser.nodes if n not in nodes])
+			names.extend([n for n in parser.names if n not in names])
+		return (nodes, names)
+
+	def sig_vars(self):
+		'''adds the command line to the signature, so changing the cppcheck 
+		options, or the compilation database, will trigger a new analysis.
+		'''
+		super(cppcheck, self).sig_vars()
+		lst = [str(self.env.CPPCHECK_VERSION), str(self.cmd), _bld_compdb_sig(self.generator.bld)]
+		self.m.update(Utils.h_list(lst))
 
 	def run(self):
-		stderr = self.generator.bld.cmd_and_log(self.cmd, quiet=Context.STDERR, output=Context.STDERR)
-		self._save_xml_report(stderr)
-		defects = self._get_defects(stderr)
-		index = self._create_html_report(defects)
-		self._errors_evaluate(defects, index)
+		'''uses the cached results when available, executes cppcheck otherwise;
+		in both cases the slot taken in runnable_status will be released.
+		'''
+		try:
+			cache = self._cache_load()
+			if cache is not None:
+				try:
+					self._process(cache)
+				finally:
+					cache.close()
+				self._record_stats({'cached': True})
+			else:
+				self._execute()
+		finally:
+			if getattr(self, 'slot', False):
+				with cppcheck.lock:
+					cppcheck.running -= 1
+				self.slot = False
 		return 0
 
-	def _save_xml_report(self, s):
-		'''use cppcheck xml result string, add the command string used to invoke cppcheck
-		and save as xml file.
+	def _execute(self):
+		'''executes cppcheck; when the analysis exceeds the timeout it will be
+		executed again using half the number of preprocessor configurations.
+		'''
+		if getattr(self, 'build_dir', None) is not None:
+			self.build_dir.mkdir()
+		timeout = self.generator.bld.options.cppcheck_timeout
+		cmd = self.cmd
+		retries = 0
+		while True:
+			# results of a retry are partial, they will not be cached
+			cache = self._cache_create() if not retries else None
+			try:
+				stats = _cppcheck_execute(cmd, self._process, cache, timeout)
+			except CppcheckTimeout:
+				self._cache_discard(cache)
+				retries += 1
+				configs = re.search('--max-configs=(\d+)', cmd)
+				if configs is None or int(configs.group(1)) <= 1:
+					raise
+				n = max(1, int(configs.group(1)) // 2)
+				cmd = cmd.replace(configs.group(0), '--max-configs=%i' % n)
+				srcs = ' '.join([src.name for src in self.inputs])
+				Logs.warn('cppcheck: timeout after %ss on %s, retrying using --max-configs=%i' % (timeout, srcs, n))
+			except:
+				self._cache_discard(cache)
+				raise
+			else:
+				self._cache_commit(cache)
+				if retries:
+					self.degraded = True
+					srcs = ' '.join([src.name for src in self.inputs])
+					Logs.warn('cppcheck: partial results for %s, only checked using --max-configs=%i' % (srcs, n))
+				stats['retries'] = retries
+				self._record_stats(stats)
+				return
+
+	def post_run(self):
+		'''a degraded analysis (i.e. after a timeout) will be executed again 
+		during the next build, e.g. when using a larger timeout.
+		'''
+		super(cppcheck, self).post_run()
+		if getattr(self, 'degraded', False):
+			self.generator.bld.task_sigs.pop(self.uid(), None)
+
+	def _record_stats(self, stats):
+		'''records the statistics of the analysis, they will be reported once 
+		the build has been finished.
+		'''
+		stats['name'] = self.generator.get_name()
+		for key in ('time', 'rss', 'retries'):
+			stats.setdefault(key, 0)
+		stats.setdefault('files', [])
+		stats.setdefault('cached', False)
+		self.generator.bld.cppcheck_stats.append(stats)
+
+	def _process(self, stream):
+		'''processes the cppcheck results while they are being read from the
+		stream; either stores them for merging or creates the reports.
+		'''
+		if getattr(self, 'partial', None):
+			with open(self.partial.abspath(), 'wb') as f:
+				shutil.copyfileobj(stream, f)
+		else:
+			self._report([stream])
+
+	def _report(self, streams):
+		'''saves the results as xml; the html report will be created, and the 
+		defects will be evaluated, once the build has been finished.
+		'''
+		self._save_xml_report(streams)
+
+	def _cache_key(self):
+		'''returns the hash of all inputs that influence the results of the 
+		analysis; i.e. the cppcheck version, the command line, the compilation
+		database, the sources and all (project) headers included by those
+		sources.
+		'''
+		tgen = self.generator
+		headers = tgen.bld.node_deps.get(self.uid(), [])
+		lst = [str(tgen.env.CPPCHECK_VERSION), str(self.cmd), _bld_compdb_sig(tgen.bld)]
+		for node in self.inputs + headers:
+			lst.append(node.abspath())
+			lst.append(Utils.h_file(node.abspath()))
+		return Utils.to_hex(Utils.h_list(lst))
+
+	def _cache_load(self):
+		'''returns an open file containing the cppcheck results stored for the 
+		current inputs, or None when no results are available (or caching has 
+		been disabled).
+		'''
+		self.cache_node = None
+		path = _tgen_cache_dir(self.generator)
+		if path is None:
+			return None
+		try:
+			self.cache_node = path.make_node('%s.xml' % self._cache_key())
+		except (OSError, IOError) as e:
+			Logs.debug('cppcheck: cache disabled for %r: %r' % (self.generator.get_name(), e))
+			return None
+		try:
+			return open(self.cache_node.abspath(), 'rb')
+		except (OSError, IOError):
+			return None
+
+	def _cache_create(self):
+		'''returns a temporary file in which the results will be stored while 
+		they are being read from cppcheck, so concurrent builds never read 
+		partial results.
+		'''
+		if self.cache_node is None:
+			return None
+		try:
+			self.cache_node.parent.mkdir()
+			return open('%s.%i.tmp' % (self.cache_node.abspath(), os.getpid()), 'wb')
+		except (OSError, IOError) as e:
+			Logs.warn('cppcheck: failed to cache results for %r: %r' % (self.generator.get_name(), e))
+			return None
+
+	def _cache_commit(self, f):
+		'''stores the results for the current inputs in the cache.'''
+		if f is None:
+			return
+		f.close()
+		try:
+			os.rename(f.name, self.cache_node.abspath())
+		except (OSError, IOError) as e:
+			Logs.warn('cppcheck: failed to cache results for %r: %r' % (self.generator.get_name(), e))
+
+	def _cache_discard(self, f):
+		if f is None:
+			return
+		f.close()
+		try:
+			os.remove(f.name)
+		except OSError:
+			pass
+
+	def _save_xml_report(self, streams):
+		'''parses the cppcheck xml results element by element, adds the command 
+		string used to invoke cppcheck and saves them as xml file. Returns the 
+		list of defects found in the results.
 		'''
-		header = '%s\n' % s.split('\n')[0]
-		root = ElementTree.fromstring(s)
-		cmd = ElementTree.SubElement(root.find('cppcheck'), 'cmd')
-		cmd.text = str(self.cmd)
-		body = ElementTree.tostring(root)
 		node = self.generator.path.get_bld().find_or_declare('cppcheck.xml')
-		node.write(header + body)
+		with open(node.abspath(), 'wb') as f:
+			report = CppcheckXmlReport(f, self.cmd)
+			for stream in streams:
+				report.add(stream)
+			report.close()
+		return report.defects
+
+
+class cppcheck_merge(cppcheck):
+	'''merges the results of the cppcheck tasks created for each source file of
+	a task generator and uses them to create a single report.
+	'''
+	scan = None
+	runnable_status = Task.Task.runnable_status
+
+	def run(self):
+		def streams():
+			for node in self.inputs:
+				with open(node.abspath(), 'rb') as f:
+					yield f
+		self._report(streams())
+		return 0
+
+
+class CppcheckTimeout(Errors.WafError):
+	'''raised when a cppcheck analysis has been aborted due to a timeout.'''
+	pass
 
-	def _get_defects(self, xml_string):
-		'''evaluate the xml string returned by cppcheck (on sdterr) and use it to create
-		a list of defects.
+
+def _cppcheck_execute(cmd, process, copy=None, timeout=0):
+	'''executes cppcheck and passes the stream containing its xml results (i.e.
+	stderr) to the process function, which handles the results while they are
+	being read. A copy of the results will be written to the copy file, if any.
+	The analysis will be aborted when it takes longer than timeout seconds.
+	Returns the statistics of the analysis; i.e. the wall time, the peak memory
+	usage (in kB) and the files analyzed.
+	'''
+	pipe = Utils.subprocess.PIPE
+	if sys.platform == 'win32':
+		proc = Utils.subprocess.Popen(cmd, shell=True, stdout=pipe, stderr=pipe)
+	else:
+		# no shell, so killing the process (e.g. on timeout) will stop the analysis
+		proc = Utils.subprocess.Popen(shlex.split(cmd), stdout=pipe, stderr=pipe)
+	started = time.time()
+	progress = CppcheckProgress()
+	reader = threading.Thread(target=progress.read, args=(proc.stdout,))
+	reader.daemon = True
+	reader.start()
+
+	expired = []
+	def expire():
+		if proc.poll() is None:
+			expired.append(True)
+			proc.kill()
+	timer = None
+	if timeout > 0:
+		timer = threading.Timer(timeout, expire)
+		timer.start()
+
+	try:
+		process(CppcheckStream(proc.stderr, copy))
+		rss = _cppcheck_wait(proc)
+	except:
+		if proc.poll() is None:
+			proc.kill()
+			proc.wait()
+		if not len(expired):
+			raise
+	finally:
+		if timer is not None:
+			timer.cancel()
+		reader.join()
+
+	if len(expired):
+		raise CppcheckTimeout('cppcheck timeout after %ss: %s' % (timeout, cmd))
+	if proc.returncode:
+		raise Errors.WafError('cppcheck failed (exit status %r): %s' % (proc.returncode, cmd))
+	finished = time.time()
+	return {'time': finished - started, 'rss': rss, 'files': progress.files(finished), 'cached': False}
+
+
+def _cppcheck_wait(proc):
+	'''waits for cppcheck to finish and returns its peak memory usage (RSS) in 
+	kB, or 0 when it cannot be determined on this platform.
+	'''
+	if not hasattr(os, 'wait4'):
+		proc.wait()
+		return 0
+	try:
+		(pid, status, usage) = os.wait4(proc.pid, 0)
+	except OSError:
+		# already reaped, e.g. when polled by the timeout timer
+		proc.wait()
+		return 0
+	if os.WIFSIGNALED(status):
+		proc.returncode = -os.WTERMSIG(status)
+	else:
+		proc.returncode = os.WEXITSTATUS(status)
+	if sys.platform == 'darwin':
+		return usage.ru_maxrss // 1024
+	return usage.ru_maxrss
+
+
+class CppcheckProgress(object):
+	'''collects the files analyzed, and the number of preprocessor 
+	configurations tried for each file, from the progress reported by cppcheck
+	on stdout, e.g.:
+
+		Checking src/foo.c ...
+		Checking src/foo.c: DEBUG...
+		1/2 files checked 50% done
+	'''
+	def __init__(self):
+		self.checked = []
+
+	def read(self, stream):
+		for line in iter(stream.readline, ''):
+			self.add(line.strip(), time.time())
+
+	def add(self, line, now):
+		if not line.startswith('Checking ') or not line.endswith('...'):
+			return
+		name = line[len('Checking '):-len('...')].strip()
+		if ': ' in name:
+			if len(self.checked):
+				self.checked[-1]['configs'] += 1
+		else:
+			self.checked.append({'file': name, 'started': now, 'configs': 1})
+
+	def files(self, finished):
+		'''returns the files analyzed, including the time spent on each file.'''
+		lst = []
+		for (i, f) in enumerate(self.checked):
+			if i + 1 < len(self.checked):
+				end = self.checked[i + 1]['started']
+			else:
+				end = finished
+			lst.append({'file': f['file'], 'time': end - f['started'], 'configs': f['configs']})
+		return lst
+
+
+class CppcheckStream(object):
+	'''file like object returning the data read from a (cppcheck) stream while
+	writing a copy of that data to another file.
+	'''
+	def __init__(self, stream, copy=None):
+		self.stream = stream
+		self.copy = copy
+
+	def read(self, size=-1):
+		data = self.stream.read(size)
+		if self.copy is not None:
+			self.copy.write(data)
+		return data
+
+
+class CppcheckXmlReport(object):
+	'''writes a cppcheck (version 2) xml report while parsing one or more 
+	cppcheck xml result streams element by element; error elements are 
+	discarded once written, so only the list of defects is kept in memory.
+	When a list of ids is given only errors having one of those ids are kept.
+	'''
+	def __init__(self, f, cmd, ids=None):
+		self.f = f
+		self.cmd = cmd
+		self.ids = ids
+		self.started = False
+		self.defects = []
+
+	def add(self, stream):
+		for elem in _xml_iter(stream):
+			if elem.tag == 'cppcheck':
+				self._start(elem)
+			elif self.ids is None or elem.get('id') in self.ids:
+				self._start()
+				self.defects.append(_get_defect(elem))
+				elem.tail = '\n'
+				self.f.write(ElementTree.tostring(elem))
+
+	def close(self):
+		self._start()
+		self.f.write('</errors>\n</results>\n')
+
+	def _start(self, version=None):
+		if self.started:
+			return
+		if version is None:
+			version = ElementTree.Element('cppcheck')
+		cmd = ElementTree.SubElement(version, 'cmd')
+		cmd.text = str(self.cmd)
+		version.tail = '\n'
+		self.f.write('<?xml version="1.0" encoding="UTF-8"?>\n<results version="2">\n')
+		self.f.write(ElementTree.tostring(version))
+		self.f.write('<errors>\n')
+		self.started = True
+
+
+def _xml_iter(stream):
+	'''parses a cppcheck xml result stream element by element and yields the 
+	'cppcheck' and 'error' elements; error elements are discarded once they
+	have been processed.
+	'''
+	errors = None
+	for event, elem in ElementTree.iterparse(stream, events=('start', 'end')):
+		if event == 'start':
+			if elem.tag == 'errors':
+				errors = elem
+		elif elem.tag == 'cppcheck':
+			yield elem
+		elif elem.tag == 'error':
+			yield elem
+			if errors is not None:
+				errors.clear()
+
+
+def _read_defects(node):
+	'''returns the list of defects stored in a cppcheck xml report.'''
+	with open(node.abspath(), 'rb') as f:
+		return [_get_defect(elem) for elem in _xml_iter(f) if elem.tag == 'error']
+
+
+def _get_defect(error):
+	'''converts a cppcheck xml error element into a defect.'''
+	defect = {}
+	defect['id'] = error.get('id')
+	defect['severity'] = error.get('severity')
+	defect['msg'] = str(error.get('msg')).replace('<','&lt;')
+	defect['verbose'] = error.get('verbose')
+	for location in error.findall('location'):
+		defect['file'] = location.get('file')
+		defect['line'] = str(int(location.get('line')) - 1)
+	return defect
+
+
+class CppcheckDefectStore(object):
+	'''keeps the defects detected by cppcheck, the suppression rules and the 
+	baseline in an (indexed) sqlite database in the build location. Defects are
+	identified using the file, the error id and the hash of the normalized
+	source line in which they have been detected, hence they can be recognized
+	even when the line numbers have been changed.
+	'''
+	def __init__(self, bld):
+		path = bld.srcnode.get_bld().make_node('.cppcheck')
+		path.mkdir()
+		self.db = sqlite3.connect(path.make_node('defects.db').abspath())
+		self.db.executescript(CPPCHECK_DB_SCHEMA)
+		self.lines = {}
+
+	def close(self):
+		self.db.commit()
+		self.db.close()
+
+	def update(self, name, defects, suppressions):
+		'''replaces the defects and suppression rules stored for a task 
+		generator, returns the defects that have not been suppressed.
 		'''
-		defects = []
-		for error in ElementTree.fromstring(xml_string).iter('error'):
-			defect = {}
-			defect['id'] = error.get('id')
-			defect['severity'] = error.get('severity')
-			defect['msg'] = str(error.get('msg')).replace('<','&lt;')
-			defect['verbose'] = error.get('verbose')
-			for location in error.findall('location'):
-				defect['file'] = location.get('file')
-				defect['line'] = str(int(location.get('line')) - 1)
-			defects.append(defect)
-		return defects
-
-	def _create_html_report(self, defects):
-		files, css_style_defs = self._create_html_files(defects)
-		index = self._create_html_index(files)
-		self._create_css_file(css_style_defs)
-		return index
-
-	def _create_html_files(self, defects):
-		sources = {}
-		defects = [defect for defect in defects if defect.has_key('file')]
+		db = self.db
+		db.execute('DELETE FROM defects WHERE task=?', (name,))
+		db.execute('DELETE FROM suppressions WHERE task=?', (name,))
+		db.executemany('INSERT INTO suppressions VALUES (?,?,?,?)', [(name,) + s for s in suppressions])
+
+		if name == CPPCHECK_PROJECT:
+			rules = db.execute('SELECT id, file, line FROM suppressions').fetchall()
+		else:
+			rules = suppressions
+
+		kept = []
 		for defect in defects:
+			if self._suppressed(defect, rules):
+				continue
+			defect['hash'] = self._hash(defect)
+			line = int(defect['line']) + 1 if defect.has_key('line') else None
+			db.execute('INSERT INTO defects VALUES (?,?,?,?,?,?,?)', (name, defect.get('file', ''), 
+				defect['id'], defect['hash'], defect['severity'], defect['msg'], line))
+			kept.append(defect)
+		return kept
+
+	def record_baseline(self):
+		'''uses all currently stored defects as baseline.'''
+		self.db.execute('DELETE FROM baseline')
+		self.db.execute('INSERT OR IGNORE INTO baseline SELECT file, id, hash FROM defects')
+
+	def new(self, defects):
+		'''returns the defects that are not part of the baseline.'''
+		sql = 'SELECT 1 FROM baseline WHERE file=? AND id=? AND hash=?'
+		return [d for d in defects if self.db.execute(sql, (d.get('file', ''), d['id'], d['hash'])).fetchone() is None]
+
+	def _suppressed(self, defect, rules):
+		for (id, f, line) in rules:
+			if not fnmatch.fnmatchcase(defect['id'], id):
+				continue
+			if f and not fnmatch.fnmatchcase(defect.get('file', ''), f):
+				continue
+			if line is not None and (not defect.has_key('line') or int(defect['line']) + 1 != line):
+				continue
+			return True
+		return False
+
+	def _hash(self, defect):
+		'''returns the hash of the (normalized) source line of the defect.'''
+		text = ''
+		if defect.has_key('file') and defect.has_key('line'):
 			name = defect['file']
-			if not sources.has_key(name):
-				sources[name] = [defect]
-			else:
-				sources[name].append(defect)
-		
-		files = {}
-		css_style_defs = None
-		bpath = self.generator.path.get_bld().abspath()
-		names = sources.keys()
-		for i in range(0,len(names)):
-			name = names[i]
-			htmlfile = 'cppcheck/%i.html' % (i)
-			errors = sources[name]
-			files[name] = { 'htmlfile': '%s/%s' % (bpath, htmlfile), 'errors': errors }
-			css_style_defs = self._create_html_file(name, htmlfile, errors)
-		return files, css_style_defs
-
-	def _create_html_file(self, sourcefile, htmlfile, errors):
-		name = self.generator.get_name()
-		root = ElementTree.fromstring(CPPCHECK_HTML_FILE)
-		title = root.find('head/title')
-		title.text = 'cppcheck - report - %s' % name
-
-		body = root.find('body')
-		for div in body.findall('div'):
-			if div.get('id') == 'page':
-				page = div
-				break
-		for div in page.findall('div'):
-			if div.get('id') == 'header':
-				h1 = div.find('h1')
-				h1.text = 'cppcheck report - %s' % name
-			if div.get('id') == 'content':
-				content = div
-				srcnode = self.generator.bld.root.find_node(sourcefile)
-				hl_lines = [e['line'] for e in errors if e.has_key('line')]
-				formatter = CppcheckHtmlFormatter(linenos=True, style='colorful', hl_lines=hl_lines, lineanchors='line')
-				formatter.errors = [e for e in errors if e.has_key('line')]
-				css_style_defs = formatter.get_style_defs('.highlight')
-				lexer = pygments.lexers.guess_lexer_for_filename(sourcefile, "")
-				s = pygments.highlight(srcnode.read(), lexer, formatter)
-				table = ElementTree.fromstring(s)
-				content.append(table)
-
-		s = ElementTree.tostring(root, method='html')
-		s = CCPCHECK_HTML_TYPE + s
-		node = self.generator.path.get_bld().find_or_declare(htmlfile)
-		node.write(s)
-		return css_style_defs
-
-	def _create_html_index(self, files):
-		name = self.generator.get_name()
-		root = ElementTree.fromstring(CPPCHECK_HTML_FILE)
-		title = root.find('head/title')
-		title.text = 'cppcheck - report - %s' % name
-
-		body = root.find('body')
-		for div in body.findall('div'):
-			if div.get('id') == 'page':
-				page = div
-				break
-		for div in page.findall('div'):
-			if div.get('id') == 'header':
-				h1 = div.find('h1')
-				h1.text = 'cppcheck report - %s' % name
-			if div.get('id') == 'content':
-				content = div
-				self._create_html_table(content, files)
-
-		s = ElementTree.tostring(root, method='html')
-		s = CCPCHECK_HTML_TYPE + s
-		node = self.generator.path.get_bld().find_or_declare('cppcheck/index.html')
-		node.write(s)
-		return node
+			if not self.lines.has_key(name):
+				try:
+					with open(name, 'r') as f:
+						self.lines[name] = f.readlines()
+				except (OSError, IOError):
+					self.lines[name] = []
+			lines = self.lines[name]
+			i = int(defect['line'])
+			if i >= 0 and i < len(lines):
+				text = ' '.join(lines[i].split())
+		return Utils.to_hex(Utils.h_list([defect['id'], text]))
+
+
+class CppcheckHtmlReport(object):
+	'''creates a single, project wide, (pygments highlighted) html report of the
+	defects detected by cppcheck in the 'cppcheck' directory of the top level
+	build location.
+
+	Each highlighted source file is stored using the hash of its contents and 
+	defects as name, hence a file will only be rendered (again) when either its
+	contents or its defects have been changed. Files are rendered in parallel 
+	using a pool of worker processes.
+	'''
+	def __init__(self, bld):
+		self.bld = bld
+		self.path = bld.srcnode.get_bld().make_node('cppcheck')
+		self.name = getattr(Context.g_module, Context.APPNAME, os.path.basename(bld.srcnode.abspath()))
+
+	def create(self, results):
+		'''creates the html files, index and style sheet for a list of (task 
+		generator name, defects) results and returns the node of the index file.
+		'''
+		self.path.mkdir()
+		files = self._create_html_files(self._get_sources(results))
+		self._create_css_file()
+		return self._create_html_index(results, files)
 
-	def _create_html_table(self, content, files):
+	def _get_sources(self, results):
+		'''returns the (unique) defects per source file for all task generators.'''
+		sources = {}
+		keys = set()
+		for name, defects in results:
+			for defect in defects:
+				if not defect.has_key('file'):
+					continue
+				key = (defect['file'], defect['id'], defect.get('line'), defect['msg'])
+				if key in keys:
+					continue
+				keys.add(key)
+				sources.setdefault(defect['file'], []).append(defect)
+		return sources
+
+	def _create_html_files(self, sources):
+		files = {}
+		jobs = []
+		for name, errors in sources.items():
+			if not os.path.isfile(name):
+				Logs.warn("cppcheck: source '%s' not found, skipping html file" % name)
+				continue
+			errors = sorted(errors, key=_defect_line)
+			sig = [Utils.h_file(name)] + [repr(sorted(e.items())) for e in errors]
+			htmlfile = '%s.html' % Utils.to_hex(Utils.h_list(sig))
+			files[name] = { 'htmlfile': htmlfile, 'errors': errors }
+			node = self.path.make_node(htmlfile)
+			if not os.path.exists(node.abspath()):
+				jobs.append((name, node.abspath(), errors))
+
+		if len(jobs) > 1 and self.bld.jobs > 1 and sys.platform != 'win32':
+			pool = multiprocessing.Pool(min(self.bld.jobs, len(jobs)))
+			try:
+				pool.map(_create_html_file, jobs)
+				pool.close()
+			except:
+				pool.terminate()
+				raise
+			finally:
+				pool.join()
+		else:
+			for job in jobs:
+				_create_html_file(job)
+
+		htmlfiles = set([f['htmlfile'] for f in files.values()])
+		for name in os.listdir(self.path.abspath()):
+			if name.endswith('.html') and name != 'index.html' and name not in htmlfiles:
+				os.remove(os.path.join(self.path.abspath(), name))
+		return files
+
+	def _create_html_index(self, results, files):
+		root, content = _html_page(self.name)
 		table = ElementTree.fromstring(CPPCHECK_HTML_TABLE)
-		for name, val in files.items():
-			f = val['htmlfile']
-			s = '<tr><td colspan="4"><a href="%s">%s</a></td></tr>\n' % (f,name)
-			row = ElementTree.fromstring(s)
-			table.append(row)
-
-			errors = sorted(val['errors'], key=lambda e: int(e['line']) if e.has_key('line') else sys.maxint)
-			for e in errors:
-				if not e.has_key('line'):
-					s = '<tr><td></td><td>%s</td><td>%s</td><td>%s</td></tr>\n' % (e['id'], e['severity'], e['msg'])
-				else:
-					attr = ''
-					if e['severity'] == 'error':
-						attr = 'class="error"'
-					s = '<tr><td><a href="%s#line-%s">%s</a></td>' % (f, e['line'], e['line'])
-					s+= '<td>%s</td><td>%s</td><td %s>%s</td></tr>\n' % (e['id'], e['severity'], attr, e['msg'])
-				row = ElementTree.fromstring(s)
-				table.append(row)
+		for name, defects in sorted(results, key=lambda r: r[0]):
+			s = '<tr><th colspan="4"><a name="%s">%s</a></th></tr>\n' % (name, name)
+			table.append(ElementTree.fromstring(s))
+
+			sources = {}
+			for defect in defects:
+				if defect.has_key('file') and files.has_key(defect['file']):
+					sources.setdefault(defect['file'], []).append(defect)
+
+			for source in sorted(sources.keys()):
+				f = files[source]['htmlfile']
+				s = '<tr><td colspan="4"><a href="%s">%s</a></td></tr>\n' % (f, source)
+				table.append(ElementTree.fromstring(s))
+
+				for e in sorted(sources[source], key=_defect_line):
+					if not e.has_key('line'):
+						s = '<tr><td></td><td>%s</td><td>%s</td><td>%s</td></tr>\n' % (e['id'], e['severity'], e['msg'])
+					else:
+						attr = ''
+						if e['severity'] == 'error':
+							attr = 'class="error"'
+						s = '<tr><td><a href="%s#line-%s">%s</a></td>' % (f, e['line'], e['line'])
+						s+= '<td>%s</td><td>%s</td><td %s>%s</td></tr>\n' % (e['id'], e['severity'], attr, e['msg'])
+					table.append(ElementTree.fromstring(s))
 		content.append(table)
 
-	def _create_css_file(self, css_style_defs):
-		css = str(CPPCHECK_CSS_FILE)
-		if css_style_defs:
-			css = "%s\n%s\n" % (css, css_style_defs)
-		node = self.generator.path.get_bld().find_or_declare('cppcheck/style.css')
-		node.write(css)
-
-	def _errors_evaluate(self, errors, http_index):
-		name = self.generator.get_name()			
-		fatal = self.fatal
-		severity = [err['severity'] for err in errors]
-		problems = [err for err in errors if err['severity'] != 'information']
-
-		if set(fatal) & set(severity):
-			exc  = "\n"
-			exc += "\nccpcheck detected fatal error(s) in task '%s', see report for details:" % name
-			exc += "\n    file://%r" % (http_index)
-			exc += "\n"
-			self.generator.bld.fatal(exc)
+		node = self.path.make_node('index.html')
+		node.write(CCPCHECK_HTML_TYPE + ElementTree.tostring(root, method='html'))
+		return node
 
-		elif len(problems):
-			msg =  "\nccpcheck detected (possible) problem(s) in task '%s', see report for details:" % name
-			msg += "\n    file://%r" % http_index
-			msg += "\n"
-			Logs.error(msg)
+	def _create_css_file(self):
+		formatter = CppcheckHtmlFormatter(style='colorful')
+		css = "%s\n%s\n" % (CPPCHECK_CSS_FILE, formatter.get_style_defs('.highlight'))
+		node = self.path.make_node('style.css')
+		if not os.path.exists(node.abspath()) or node.read() != css:
+			node.write(css)
+
+
+def _html_page(name):
+	'''returns the root and content elements of a new html report page.'''
+	root = ElementTree.fromstring(CPPCHECK_HTML_FILE)
+	title = root.find('head/title')
+	title.text = 'cppcheck - report - %s' % name
+
+	body = root.find('body')
+	for div in body.findall('div'):
+		if div.get('id') == 'page':
+			page = div
+			break
+	for div in page.findall('div'):
+		if div.get('id') == 'header':
+			h1 = div.find('h1')
+			h1.text = 'cppcheck report - %s' % name
+		if div.get('id') == 'content':
+			content = div
+	return root, content
+
+
+def _create_html_file(job):
+	'''creates the highlighted html file of a single source file; executed in 
+	a worker process when rendering in parallel.
+	'''
+	(sourcefile, htmlfile, errors) = job
+	root, content = _html_page(os.path.basename(sourcefile))
+
+	hl_lines = [e['line'] for e in errors if e.has_key('line')]
+	formatter = CppcheckHtmlFormatter(linenos=True, style='colorful', hl_lines=hl_lines, lineanchors='line')
+	formatter.errors = {}
+	for e in errors:
+		if e.has_key('line'):
+			formatter.errors.setdefault(int(e['line']), []).append(e)
+	lexer = pygments.lexers.guess_lexer_for_filename(sourcefile, "")
+	with open(sourcefile, 'r') as f:
+		s = pygments.highlight(f.read(), lexer, formatter)
+	content.append(ElementTree.fromstring(s))
+
+	s = CCPCHECK_HTML_TYPE + ElementTree.tostring(root, method='html')
+	tmp = '%s.%i.tmp' % (htmlfile, os.getpid())
+	with open(tmp, 'w') as f:
+		f.write(s)
+	os.rename(tmp, htmlfile)
+
+
+def _defect_line(defect):
+	return int(defect['line']) if defect.has_key('line') else sys.maxint
 
 
 class CppcheckHtmlFormatter(pygments.formatters.HtmlFormatter):
-	errors = []
+	errors = {}
 
 	def wrap(self, source, outfile):
 		line_no = 1
 		for i, t in super(CppcheckHtmlFormatter, self).wrap(source, outfile):
 			# If this is a source code line we want to add a span tag at the end.
 			if i == 1:
-				for error in self.errors:
-					if int(error['line']) == line_no:
-						t = t.replace('\n', CPPCHECK_HTML_ERROR % error['msg'])
+				for error in self.errors.get(line_no, []):
+					t = t.replace('\n', CPPCHECK_HTML_ERROR % error['msg'])
 				line_no = line_no + 1
 			yield i, t
 
 
+CPPCHECK_PROJECT = 'whole-program'
+
+# ids of the defects that can only be detected by the whole program checks, 
+# all other defects have already been reported when checking each target
+CPPCHECK_PROJECT_IDS = [
+	'unusedFunction',
+	'ctunullpointer',
+	'ctuuninitvar',
+	'ctuArrayIndex',
+	'ctuPointerArith',
+	'ctuOneDefinitionRuleViolation',
+]
+
+CPPCHECK_DB_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS defects (task TEXT, file TEXT, id TEXT, hash TEXT, severity TEXT, msg TEXT, line INTEGER);
+CREATE TABLE IF NOT EXISTS baseline (file TEXT, id TEXT, hash TEXT, PRIMARY KEY (file, id, hash));
+CREATE TABLE IF NOT EXISTS suppressions (task TEXT, id TEXT, file TEXT, line INTEGER);
+CREATE INDEX IF NOT EXISTS defects_task ON defects (task);
+CREATE INDEX IF NOT EXISTS defects_key ON defects (file, id, hash);
+CREATE INDEX IF NOT EXISTS suppressions_task ON suppressions (task);
+'''
+
 CCPCHECK_HTML_TYPE = \
 '<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01//EN" "http://www.w3.org/TR/html4/strict.dtd">\n'
 
@@ -19,6 +19,30 @@ The generated makefile supports following arguments:
 	'make uninstall [PREFIX=<prefix>]'
 	'make <target>'
 
+Each object depends on its source file and the (project) headers included by
+that source, each binary and library on the objects and libraries it is linked
+with, while the output directories are created using order-only prerequisites.
+Hence the makefile can be used for parallel builds (e.g. 'make -j8') and will
+only rebuild targets of which the sources or headers have been changed.
+
+Objects that are compiled using the same command (i.e. the same compiler 
+and flags) are grouped per task generator; the flags and objects of each group
+are stored in makefile variables (e.g. 'foo_FLAGS' and 'foo_OBJS') and the 
+objects are compiled using a (static) pattern rule, which keeps the makefile
+compact even for large projects.
+
+When a compiler launcher (e.g. ccache) has been configured using the 
+'--compiler-launcher' option, it will be used by the makefile as well. It can 
+be changed, or disabled, using the 'CC_LAUNCHER' variable, for example;
+	'make CC_LAUNCHER=sccache'
+	'make CC_LAUNCHER='
+
+Headers that are included after the makefile has been exported will only be 
+known to make when using the '--makefile-depfiles' option; the compiler will 
+then write the headers included by each source into a dependency file (i.e. 
+using '-MMD -MP') which will be included by the makefile. This option is only
+supported for gcc compatible compilers (i.e. gcc, clang and icc).
+
 Based on the example shown below, in which two build environments exist (one 
 for native host compilation and one for cross-compilation for win32 targets),
 two makefiles will be generated. The makefile for the native environment will
@@ -59,9 +83,13 @@ be named 'MakeFile' while the makefile for the cross compilation environment
 
 Remarks
 -------
-This module will ALLWAYS first remove any results from a previous build, i.e. 
-it will allways start with a 'waf clean', after which a normal build will be 
-started, during which the C/C++ tasks will be converted and exported. 
+The C/C++ tasks will be exported using the commands that have been recorded 
+during the last build (see the capture waftool); commands of tasks that have 
+been changed since, or have not been build yet, will be composed from the 
+environments of the task generators and the command templates (i.e. run_str)
+of the C/C++ tasks, without executing the compiler or linker. Hence the build
+will neither be cleaned nor executed and existing build results will be left
+untouched.
 
 Usage
 =====
@@ -78,6 +106,8 @@ In order to generate the makefile issue the following command:
 	'waf makefile'
 Or
 	'waf makefile_<variant>'
+Or, for all configured variants at once:
+	'waf makefile_all'
 
 Assuming of course a variant makefile command has been created as shown in the
 example environment setup above.
@@ -93,11 +123,14 @@ as the installation root.
 import os
 import re
 import datetime
-from waflib import Build, Logs, Scripting, Task, Context, Tools
+import capture
+from waflib import Build, Logs, Context, Tools
 
 
 def options(opt):
-	pass
+	opt.add_option('--makefile-depfiles', dest='makefile_depfiles',
+		default=False, action='store_true',
+		help='let the compiler generate header dependencies (-MMD -MP) in the makefile (default=False)')
 
 
 def configure(conf): 
@@ -113,42 +146,31 @@ class MakefileContext(Build.BuildContext):
 		self.failure = None
 		self.commands = []
 		self.targets = []
+		self.phony = []
+		self.directories = []
+		self.depfiles = []
+		self.objects = []
+
+		capture.capture_export(self, task_process)
+		postfun(self)
+
+
+class MakefileAllContext(Build.BuildContext):
+	'''exports and converts C/C++ tasks of all variants to MakeFile(s).'''
+	fun = 'build'
+	cmd = 'makefile_all'
 
-		old_exec = Task.TaskBase.exec_command
-		def exec_command(self, *k, **kw):
-			ret = old_exec(self, *k, **kw)
-			try:
-				cmd = k[0]
-			except IndexError:
-				cmd = ''
-			finally:
-				self.command_executed = cmd
-			try:
-				cwd = kw['cwd']
-			except KeyError:
-				cwd = self.generator.bld.cwd
-			finally:
-				self.path = cwd
-			return ret
-		Task.TaskBase.exec_command = exec_command
-
-		old_process = Task.TaskBase.process
-		def process(self):
-			old_process(self)
-			task_process(self)
-		Task.TaskBase.process = process
-
-		def postfun(self):
-			if self.failure:
-				build_show_failure(self)
-			elif not len(self.targets):
-				Logs.warn('makefile export failed: no C/C++ targets found')
-			else:
-				build_postfun(self)
-		super(MakefileContext, self).add_post_fun(postfun)
-
-		Scripting.run_command('clean')
-		super(MakefileContext, self).execute(*k, **kw)
+	def execute(self):
+		capture.capture_export_variants(self, MakefileContext)
+
+
+def postfun(bld):
+	if bld.failure:
+		build_show_failure(bld)
+	elif not len(bld.targets):
+		Logs.warn('makefile export failed: no C/C++ targets found')
+	else:
+		build_postfun(bld)
 
 
 def task_process(task):
@@ -173,7 +195,8 @@ def makefile_compile(task):
 	bld.targets.extend(lst)
 
 	try:
-		if isinstance(task.command_executed, list):
+		cmd = task.command_executed
+		if isinstance(cmd, list):
 			t = bld.path.abspath()
 			inc = "-I%s" % t
 			cmd = []
@@ -184,15 +207,40 @@ def makefile_compile(task):
 					c = c.lstrip('../')
 				if c.endswith('.o'):
 					c = "%s/%s" % (top, c)
-				cmd.append(c)
-			task.command_executed = ' \\\n\t'.join(cmd)
+				cmd.append(makefile_prefix(bld, c))
+			launcher = [str(l) for l in task.env.COMPILER_LAUNCHER]
+			if len(launcher) and cmd[:len(launcher)] == launcher:
+				cmd = cmd[len(launcher):]
+			if makefile_depfiles(task):
+				cmd[1:1] = ['-MMD', '-MP']
+				bld.depfiles.append('%s.d' % os.path.splitext(lst[0])[0])
 	except Exception as exception:
 		bld.failure = (exception, task, getattr(task,"command_executed",[]))
 	else:
 		target = lst.pop(0)
-		bld.commands.append('%s:' % target)
-		bld.commands.append('\tmkdir -p %s' % os.path.dirname(target))
-		bld.commands.append('\t%s' % task.command_executed)
+		source = makefile_path(bld, task.inputs[0])
+		deps = bld.node_deps.get(task.uid(), [])
+		deps = [makefile_path(bld, d) for d in deps if not d.is_child_of(bld.bldnode)]
+		makefile_directory(bld, target)
+		bld.objects.append((task.generator.get_name(), target, source, deps, cmd))
+
+
+def makefile_depfiles(task):
+	'''returns True when header dependency files should be generated by the
+	compiler of the given compile task.
+	'''
+	if not task.generator.bld.options.makefile_depfiles:
+		return False
+	if isinstance(task, Tools.cxx.cxx):
+		name = task.env.CXX_NAME
+	else:
+		name = task.env.CC_NAME
+	if name not in ('gcc', 'clang', 'icc'):
+		if name not in DEPFILES_UNSUPPORTED:
+			DEPFILES_UNSUPPORTED.append(name)
+			Logs.warn('makefile: dependency files not supported for compiler %r' % name)
+		return False
+	return True
 
 
 def makefile_link(task):
@@ -228,16 +276,50 @@ def makefile_link(task):
 					c = '-Wl,--out-implib,%s/%s' % (top, c.split(',')[2])
 				elif c.endswith('.a') or c.endswith('.o'):
 					c = "%s/%s" % (top, c)
-				cmd.append(c)
+				cmd.append(makefile_prefix(bld, c))
 			task.command_executed = ' \\\n\t'.join(cmd)
 	except Exception as exception:
 		bld.failure = (exception, task, getattr(task,"command_executed",[]))
 	else:
-		bld.commands.append('%s: \\' % os.path.basename(str(lst.pop(0))))
-		bld.commands.append('\t%s' % ' \\\n\t'.join([str(l) for l in lst]))
+		target = str(lst.pop(0))
+		name = os.path.basename(target)
+		bld.phony.append(name)
+		bld.commands.append('%s: %s' % (name, target))
+		bld.commands.append('%s: \\' % target)
+		bld.commands.append('\t%s \\' % ' \\\n\t'.join([str(l) for l in lst]))
+		bld.commands.append('\t| %s' % makefile_directory(bld, target))
 		bld.commands.append('\t%s' % task.command_executed)
 
 
+def makefile_path(bld, node):
+	'''returns the path of a node as used in the makefile; i.e. relative to 
+	the top level directory or absolute when located outside of it.
+	'''
+	if node.is_child_of(bld.path):
+		return node.path_from(bld.path)
+	return node.abspath()
+
+
+def makefile_prefix(bld, s):
+	'''replaces the installation prefix in the given string by a reference to 
+	the 'PREFIX' makefile variable.
+	'''
+	prefix = str(bld.env.PREFIX).rstrip('/')
+	if not len(prefix):
+		return s
+	return s.replace(prefix, '$(PREFIX)')
+
+
+def makefile_directory(bld, target):
+	'''returns the directory of a target and adds it to the list of 
+	directories to be created by the makefile.
+	'''
+	directory = os.path.dirname(target)
+	if directory not in bld.directories:
+		bld.directories.append(directory)
+	return directory
+
+
 def build_show_failure(bld):
 	(err, tsk, cmd) = bld.failure
 	msg = "export failure:\n"
@@ -253,15 +335,27 @@ def build_postfun(bld):
 	appname = getattr(Context.g_module, Context.APPNAME, srcnode)
 	version = getattr(Context.g_module, Context.VERSION, srcnode)
 	prefix = str(bld.env.PREFIX)
-	bindir = str(bld.env.BINDIR)
-	libdir = str(bld.env.LIBDIR)
+	bindir = makefile_prefix(bld, str(bld.env.BINDIR))
+	libdir = makefile_prefix(bld, str(bld.env.LIBDIR))
 	binaries = [t for t in targets if t.split('.')[-1] not in ('a','o','so')]
 	libraries = [t for t in targets if t.endswith('.so')] # treat dll as bin
 
+	(groups, objects) = makefile_groups(bld)
+	depfiles = set(bld.depfiles)
+	grouped = set()
+	for (name, key, lst) in groups:
+		grouped.update([l[1] for l in lst])
+
 	tgt = [t for t in targets if not t.endswith('.dll.a')] # skip import libs
-	tgt = [t if t.endswith('.o') else os.path.basename(t) for t in tgt]
+	tgt = [t for t in tgt if t not in grouped]
+	tgt = ['$(%s_OBJS)' % name for (name, key, lst) in groups] + [t if t.endswith('.o') else os.path.basename(t) for t in tgt]
 	tgt_all = " \\\n\t".join(tgt)
-	tgt_clean = "\n\t".join(["rm -rf %s" % t for t in targets])
+
+	clean = ['$(%s_OBJS)' % name for (name, key, lst) in groups]
+	clean += [t for t in targets if t not in grouped]
+	clean += ['$(%s_OBJS:.o=.d)' % name for (name, key, lst) in groups if '%s.d' % lst[0][1][:-2] in depfiles]
+	clean += [d for d in bld.depfiles if '%s.o' % d[:-2] not in grouped]
+	tgt_clean = "\n\t".join(["rm -rf %s" % t for t in clean])
 
 	bini = ["cp %s %s/%s" % (b, bindir, os.path.basename(b)) for b in binaries]
 	libi = ["cp %s %s/%s" % (l, libdir, os.path.basename(l)) for l in libraries]
@@ -271,33 +365,147 @@ def build_postfun(bld):
 	libu = ["rm -rf %s/%s" % (libdir, os.path.basename(l)) for l in libraries]
 	tgt_uninstall = "\n\t".join(binu+libu)
 
-	tgt = [c if c.startswith('\t') else "\n%s" % (c) for c in bld.commands]
-	tgt_targets = str("\n".join(tgt)).lstrip('\n')
-
-	s = str(MAKEFILE_TEMPLATE)
-	s = re.sub('\$\(APPNAME\)', appname, s)
-	s = re.sub('\$\(VERSION\)', version, s)
-	s = re.sub('\$\(WAFVERSION\)', Context.WAFVERSION, s)
-	s = re.sub('\$\(DATETIME\)', str(datetime.datetime.now()), s)
-	s = re.sub('\$\(BINDIR\)', bindir, s)
-	s = re.sub('\$\(LIBDIR\)', libdir, s)
-	s = re.sub('\$\(TGT_ALL\)', tgt_all, s)
-	s = re.sub('\$\(TGT_CLEAN\)', tgt_clean, s)
-	s = re.sub('\$\(TGT_INSTALL\)', tgt_install, s)
-	s = re.sub('\$\(TGT_UNINSTALL\)', tgt_uninstall, s)
-	s = re.sub('\$\(TGT_TARGETS\)', tgt_targets, s)
-	s = re.sub(prefix, '$(PREFIX)', s)
-	s = re.sub('PREFIX=', 'PREFIX=%s' % re.sub('\A/home/.*?/','~/',prefix), s)
+	tgt_phony = " \\\n\t".join(bld.phony)
+	tgt_directories = "\n\n".join(["%s:\n\tmkdir -p $@" % d for d in bld.directories])
+	dep = ['$(%s_OBJS:.o=.d)' % name for (name, key, lst) in groups if '%s.d' % lst[0][1][:-2] in depfiles]
+	dep += [d for d in bld.depfiles if '%s.o' % d[:-2] not in grouped]
+	tgt_depfiles = " \\\n\t".join(dep)
+
+	values = {
+		'APPNAME': appname,
+		'VERSION': version,
+		'WAFVERSION': Context.WAFVERSION,
+		'DATETIME': str(datetime.datetime.now()),
+		'DEFAULT_PREFIX': re.sub('\A/home/.*?/','~/',prefix),
+		'DEFAULT_CC_LAUNCHER': ' '.join(bld.env.COMPILER_LAUNCHER),
+		'BINDIR': bindir,
+		'LIBDIR': libdir,
+		'TGT_ALL': tgt_all,
+		'TGT_CLEAN': tgt_clean,
+		'TGT_INSTALL': tgt_install,
+		'TGT_UNINSTALL': tgt_uninstall,
+		'TGT_PHONY': tgt_phony,
+		'TGT_DIRECTORIES': tgt_directories,
+		'TGT_OBJECTS': makefile_objects(bld, groups, objects),
+		'TGT_TARGETS': makefile_targets(bld),
+		'TGT_DEPFILES': tgt_depfiles,
+	}
 
 	if bld.variant:
 		name = '%s-%s.mk' % (appname, bld.variant)
 	else:
 		name = 'Makefile'
 	node = bld.path.make_node(name)
-	node.write(s)
+	with open(node.abspath(), 'w') as f:
+		makefile_write(f, MAKEFILE_TEMPLATE, values)
 	Logs.warn('exported: %s' % node.abspath())
 
 
+def makefile_groups(bld):
+	'''groups the objects of each task generator that are compiled using the 
+	same command; i.e. using the same compiler and flags. Returns the list of 
+	(name, key, objects) groups and the list of objects that cannot be compiled 
+	using a pattern rule.
+	'''
+	top = bld.bldnode.path_from(bld.path)
+	groups = []
+	index = {}
+	names = set()
+	objects = []
+	for obj in bld.objects:
+		(name, target, source, deps, cmd) = obj
+		key = makefile_group_key(top, target, source, cmd)
+		if key is None:
+			objects.append(obj)
+			continue
+		if (name, key) not in index:
+			var = re.sub('[^A-Za-z0-9_]', '_', name)
+			if var in names:
+				var = '%s_%i' % (var, len(names))
+			names.add(var)
+			index[(name, key)] = (var, key, [])
+			groups.append(index[(name, key)])
+		index[(name, key)][2].append(obj)
+	return (groups, objects)
+
+
+def makefile_group_key(top, target, source, cmd):
+	'''returns the (compiler, flags, options, suffix) key of an object, or None
+	when the object cannot be compiled using a pattern rule; i.e. when its 
+	path does not match the path of its source in the build directory.
+	'''
+	if not isinstance(cmd, list) or source not in cmd or target not in cmd:
+		return None
+	prefix = '%s/%s' % (top, source)
+	if not target.startswith(prefix):
+		return None
+	i = cmd.index(source)
+	options = ['$@' if c == target else c for c in cmd[i+1:]]
+	return (cmd[0], tuple(cmd[1:i]), tuple(options), target[len(prefix):])
+
+
+def makefile_objects(bld, groups, objects):
+	'''yields the variables and (static) pattern rules for each group of 
+	objects, the additional (header) prerequisites of each object and the rules
+	of objects that cannot be compiled using a pattern rule.
+	'''
+	top = bld.bldnode.path_from(bld.path)
+	for (name, key, lst) in groups:
+		(cc, flags, options, suffix) = key
+		dirs = []
+		for (tgen, target, source, deps, cmd) in lst:
+			if os.path.dirname(target) not in dirs:
+				dirs.append(os.path.dirname(target))
+		yield '%s_FLAGS = %s' % (name, ' '.join(flags))
+		yield '%s_OBJS = \\\n\t%s' % (name, ' \\\n\t'.join([l[1] for l in lst]))
+		yield ''
+		yield '$(%s_OBJS): %s/%%%s: %% | %s' % (name, top, suffix, ' '.join(dirs))
+		yield '\t$(CC_LAUNCHER) %s $(%s_FLAGS) $< %s' % (cc, name, ' '.join(options))
+		yield ''
+		for (tgen, target, source, deps, cmd) in lst:
+			if len(deps):
+				yield '%s: %s' % (target, ' '.join(deps))
+		yield ''
+
+	for (tgen, target, source, deps, cmd) in objects:
+		if isinstance(cmd, list):
+			cmd = '$(CC_LAUNCHER) %s' % ' \\\n\t'.join(cmd)
+		yield '%s: \\\n\t%s \\\n\t| %s' % (target, ' \\\n\t'.join([source] + deps), os.path.dirname(target))
+		yield '\t%s' % cmd
+		yield ''
+
+
+def makefile_targets(bld):
+	'''yields the (link) rules of all binaries and libraries.'''
+	for c in bld.commands:
+		if not c.startswith('\t'):
+			yield ''
+		yield c
+
+
+def makefile_write(f, template, values):
+	'''writes the makefile using a single pass over the template; variables 
+	(e.g. '$(APPNAME)') are replaced by their value while (large) sections, 
+	given as iterators, are written line by line.
+	'''
+	for line in template.splitlines(True):
+		match = MAKEFILE_SECTION.match(line)
+		if match and match.group(1) in values and not isinstance(values[match.group(1)], str):
+			for l in values[match.group(1)]:
+				f.write('%s\n' % l)
+			continue
+		f.write(MAKEFILE_VARIABLE.sub(lambda m: str(values.get(m.group(1), m.group(0))), line))
+
+
+DEPFILES_UNSUPPORTED = []
+
+
+MAKEFILE_VARIABLE = re.compile('\$\((\w+)\)')
+
+
+MAKEFILE_SECTION = re.compile('^\$\((\w+)\)\s*$')
+
+
 MAKEFILE_TEMPLATE = '''# This makefile has been generated by WAF.
 #
 # project : $(APPNAME)
@@ -306,7 +514,11 @@ MAKEFILE_TEMPLATE = '''# This makefile has been generated by WAF.
 # time    : $(DATETIME)
 #
 SHELL=/bin/sh
-PREFIX=
+PREFIX=$(DEFAULT_PREFIX)
+CC_LAUNCHER=$(DEFAULT_CC_LAUNCHER)
+
+.PHONY: all clean install uninstall \\
+	$(TGT_PHONY)
 
 all: \\
 	$(TGT_ALL)
@@ -314,7 +526,7 @@ all: \\
 clean:
 	$(TGT_CLEAN)
 
-install:
+install: all
 	mkdir -p $(BINDIR)
 	mkdir -p $(LIBDIR)
 	$(TGT_INSTALL)
@@ -322,8 +534,14 @@ install:
 uninstall:
 	$(TGT_UNINSTALL)
 
+$(TGT_DIRECTORIES)
+
+$(TGT_OBJECTS)
 $(TGT_TARGETS)
 
+-include \\
+	$(TGT_DEPFILES)
+
 '''
 
 
@@ -0,0 +1,311 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# Michel Mooij, michel.mooij7@gmail.com
+
+"""
+Tool Description
+================
+This waftool can be used for the export and conversion of all C/C++ tasks
+defined within a waf project into a single ninja build file.
+
+See http://martine.github.io/ninja/ for more information on the ninja build
+system itself.
+
+When using the ninja build file all targets will be build into the same
+location and using the same compiler and linker directives as they would have
+when using the waf build environment. Since ninja only checks which targets
+are out of date, without evaluating any (make like) rules or functions, builds
+in which nothing or only a few sources have been changed will be considerably
+faster when compared to using make.
+
+The generated ninja build file supports following arguments:
+	'ninja'
+	'ninja -t clean'
+	'ninja <target>'
+
+Headers included by each source are detected by the compiler and stored by
+ninja (i.e. using 'deps = gcc') when using a gcc compatible compiler (i.e. gcc,
+clang and icc). The objects and libraries used by each link task will be
+passed to the linker using a response file, avoiding command lines exceeding
+the limits of the platform.
+
+The ninja build file for the native environment will be named 'build.ninja'
+while those of cross compilation environments (i.e. variants) will be named;
+appname-variant.ninja. See the makefile waftool for an example of how to
+create variant commands.
+
+Remarks
+-------
+The C/C++ tasks will be exported using the commands that have been recorded
+during the last build (see the capture waftool); commands of tasks that have
+been changed since, or have not been build yet, will be composed without
+executing the compiler or linker. Hence the build will neither be cleaned nor
+executed and existing build results will be left untouched.
+
+Usage
+=====
+In order to use this tool add the following to the 'options' and 'configure'
+functions of the top level wscript in the waf build environment:
+
+	options(opt):
+		opt.load('ninja')
+
+	configure(conf):
+		conf.load('ninja')
+
+In order to generate the ninja build file issue the following command:
+	'waf ninja'
+Or
+	'waf ninja_<variant>'
+Or, for all configured variants at once:
+	'waf ninja_all'
+
+Once the ninja build file has been generated it can be used 'as-is' without
+using waf, for example;
+	'ninja -f hello-win32.ninja'
+
+will start a cross-compilation build for the win32 environment.
+"""
+
+import os
+import pipes
+import datetime
+import capture
+from waflib import Build, Logs, Context, Tools
+
+
+def options(opt):
+	pass
+
+
+def configure(conf):
+	pass
+
+
+class NinjaContext(Build.BuildContext):
+	'''exports and converts C/C++ tasks to ninja build file(s).'''
+	fun = 'build'
+	cmd = 'ninja'
+
+	def execute(self, *k, **kw):
+		self.failure = None
+		self.builds = []
+		self.targets = []
+
+		capture.capture_export(self, task_process)
+		postfun(self)
+
+
+class NinjaAllContext(Build.BuildContext):
+	'''exports and converts C/C++ tasks of all variants to ninja build file(s).'''
+	fun = 'build'
+	cmd = 'ninja_all'
+
+	def execute(self):
+		capture.capture_export_variants(self, NinjaContext)
+
+
+def postfun(bld):
+	if bld.failure:
+		build_show_failure(bld)
+	elif not len(bld.builds):
+		Logs.warn('ninja export failed: no C/C++ targets found')
+	else:
+		build_postfun(bld)
+
+
+def task_process(task):
+	'''converts the commands being executed per task into ninja build
+	statements.
+	'''
+	if not isinstance(getattr(task, 'command_executed', None), list):
+		return
+	bld = task.generator.bld
+	try:
+		if isinstance(task, Tools.c.c) or isinstance(task, Tools.cxx.cxx):
+			ninja_compile(task)
+		elif isinstance(task, Tools.ccroot.link_task):
+			ninja_link(task)
+	except Exception as exception:
+		bld.failure = (exception, task, getattr(task,"command_executed",[]))
+
+
+def ninja_compile(task):
+	'''converts a compile task into a ninja build statement; when using a gcc
+	compatible compiler the headers included by the source will be detected
+	by the compiler.
+	'''
+	cmd = ' '.join(ninja_command(task))
+	if ninja_gcc(task):
+		rule = 'cc' # adds -MMD -MF $out.d, $out is only expanded within rules
+	else:
+		rule = 'cc_nodeps'
+
+	bld = task.generator.bld
+	outputs = [ninja_path(bld, o) for o in task.outputs]
+	inputs = [ninja_path(bld, i) for i in task.inputs]
+	bld.builds.append('build %s: %s %s' % (' '.join(outputs), rule, ' '.join(inputs)))
+	bld.builds.append('  cmd = %s' % cmd)
+
+
+def ninja_link(task):
+	'''converts a link task into a ninja build statement; objects and
+	libraries will be passed to the linker using a response file.
+
+	also adds dependencies to external tasks (e.g. shared libraries),
+	including a (phony) target using the name of the binary or library.
+	'''
+	cmd = ninja_command(task)
+	if isinstance(task, Tools.ccroot.stlink_task):
+		rule = 'stlink'
+	else:
+		rule = 'link'
+	if not ninja_gcc(task):
+		rule += '_norsp'
+
+	bld = task.generator.bld
+	outputs = [ninja_path(bld, o) for o in task.outputs]
+	inputs = [ninja_path(bld, i) for i in task.inputs]
+	deps = task.dep_nodes + bld.node_deps.get(task.uid(), [])
+	deps = [ninja_path(bld, d) for d in deps if d not in task.inputs]
+	deps = [d for d in deps if not d.endswith('.dll.a')]
+
+	build = 'build %s: %s %s' % (' '.join(outputs), rule, ' '.join(inputs))
+	if len(deps):
+		build += ' | %s' % ' '.join(deps)
+	bld.builds.append(build)
+	bld.builds.append('  linker = %s' % cmd[0])
+	bld.builds.append('  args = %s' % ' '.join(cmd[1:]))
+
+	name = os.path.basename(outputs[0])
+	if name not in bld.targets:
+		bld.builds.append('build %s: phony %s' % (name, outputs[0]))
+		bld.targets.append(name)
+
+
+def ninja_command(task):
+	'''returns the executed command, as list of (quoted and escaped)
+	arguments, in which the paths of the inputs, outputs and library search
+	paths (relative to the build directory) have been replaced by paths
+	relative to the top level directory, from which ninja will execute the
+	commands.
+	'''
+	bld = task.generator.bld
+	cwd = bld.root.find_dir(str(task.path))
+	paths = {}
+	if cwd is not None:
+		for node in task.inputs + task.outputs:
+			paths[node.path_from(cwd)] = node.path_from(bld.path)
+	cmd = []
+	for c in task.command_executed:
+		c = paths.get(str(c), str(c))
+		if c.startswith('-L') and cwd is not None and not os.path.isabs(c[2:]):
+			c = '-L%s' % ninja_rebase(bld, os.path.join(cwd.abspath(), c[2:]))
+		cmd.append(pipes.quote(c).replace('$', '$$'))
+	return cmd
+
+
+def ninja_rebase(bld, path):
+	'''returns the path relative to the top level directory, or the absolute
+	path when located outside of it.
+	'''
+	path = os.path.normpath(path)
+	top = bld.path.abspath()
+	if path == top or path.startswith(top + os.sep):
+		return os.path.relpath(path, top)
+	return path
+
+
+def ninja_path(bld, node):
+	'''returns the (escaped) path of a node as used in the ninja build file;
+	i.e. relative to the top level directory or absolute when located outside
+	of it.
+	'''
+	if node.is_child_of(bld.path):
+		path = node.path_from(bld.path)
+	else:
+		path = node.abspath()
+	return path.replace('$', '$$').replace(' ', '$ ').replace(':', '$:')
+
+
+def ninja_gcc(task):
+	'''returns True when the task uses a gcc compatible compiler or linker.'''
+	if isinstance(task, Tools.cxx.cxx) or 'cxx' in getattr(task.generator, 'features', []):
+		name = task.env.CXX_NAME
+	else:
+		name = task.env.CC_NAME
+	return name in ('gcc', 'clang', 'icc')
+
+
+def build_show_failure(bld):
+	(err, tsk, cmd) = bld.failure
+	msg = "export failure:\n"
+	msg += " tsk='%s'\n" % (str(tsk).replace('\n',''))
+	msg += " err='%r'\n" % (err)
+	msg += " cmd='%s'\n" % ('\n     '.join(cmd))
+	bld.fatal(msg)
+
+
+def build_postfun(bld):
+	srcnode = os.path.basename(bld.srcnode.abspath())
+	appname = getattr(Context.g_module, Context.APPNAME, srcnode)
+	version = getattr(Context.g_module, Context.VERSION, srcnode)
+
+	s = NINJA_TEMPLATE % {
+		'appname': appname,
+		'version': version,
+		'wafversion': Context.WAFVERSION,
+		'datetime': datetime.datetime.now() }
+	s += '\n'.join(bld.builds)
+	s += '\n\nbuild all: phony %s\n' % ' '.join(bld.targets)
+	s += '\ndefault all\n'
+
+	if bld.variant:
+		name = '%s-%s.ninja' % (appname, bld.variant)
+	else:
+		name = 'build.ninja'
+	node = bld.path.make_node(name)
+	node.write(s)
+	Logs.warn('exported: %s' % node.abspath())
+
+
+NINJA_TEMPLATE = '''# This ninja build file has been generated by WAF.
+#
+# project : %(appname)s
+# version : %(version)s
+# waf     : %(wafversion)s
+# time    : %(datetime)s
+#
+ninja_required_version = 1.3
+
+rule cc
+  command = $cmd -MMD -MF $out.d
+  depfile = $out.d
+  deps = gcc
+  description = CC $out
+
+rule cc_nodeps
+  command = $cmd
+  description = CC $out
+
+rule link
+  command = $linker @$out.rsp
+  rspfile = $out.rsp
+  rspfile_content = $args
+  description = LINK $out
+
+rule link_norsp
+  command = $linker $args
+  description = LINK $out
+
+rule stlink
+  command = rm -f $out && $linker @$out.rsp
+  rspfile = $out.rsp
+  rspfile_content = $args
+  description = AR $out
+
+rule stlink_norsp
+  command = $linker $args
+  description = AR $out
+
+'''
@@ -1,136 +1,716 @@
-#!/usr/bin/env python
-
-import shutil, os, sys
-from waflib import Build, Context, Scripting, Logs
-
-
-def options(opt):
-    opt.add_option('--package_types', dest='package_types', default='all',
-                   action='store', help='package types to create (default=all)')
-
-
-def configure(conf):
-	conf.env.PACKAGE_TYPES = conf.options.package_types.split(',')
-
-	if conf.env.DEST_OS == 'win32':
-		try:
-			conf.find_program('makensis', var='NSIS')
-		except conf.errors.ConfigurationError:
-			conf.to_log('makensis was not found (ignoring)')
-
-
-class PackageContext(Build.InstallContext):
-	cmd = 'package'
-	fun = 'build'
-
-	def init_dirs(self, *k, **kw):
-		super(PackageContext, self).init_dirs(*k, **kw)
-		self._package = self.bldnode.make_node('.wafpackage')
-		try:
-			shutil.rmtree(self._package.abspath())
-		except:
-			pass
-		if os.path.exists(self._package.abspath()):
-			self.fatal('Could not remove temporary directory %r' % self._package)
-		self._package.mkdir()
-		self.options.destdir = self._package.abspath()
-
-	def execute(self, *k, **kw):
-		'''executes normal 'install' into a special, temporary, package directory
-		and creates a package (e.g. tar.bz2 or rpm) file containing all installed
-		files into this package directory.
-		'''		
-		super(PackageContext, self).execute(*k, **kw)
-
-		version = getattr(Context.g_module, Context.VERSION, self.top_dir)
-		appname = getattr(Context.g_module, Context.APPNAME, self.top_dir)
-		variant = self.variant if self.variant else ''
-		pkgtype = self.env.PACKAGE_TYPES
-		files = self._get_files()
-
-		if set(pkgtype) & set(['all', 'ls']):
-			self._package_ls(appname, variant, version, files)
-		
-		if set(pkgtype) & set(['all', 'tar.bz2']):
-			self._package_tar_bz2(appname, variant, version)
-
-		if set(pkgtype) & set(['all', 'nsis']):
-			if self.env.DEST_OS == 'win32':
-				self._package_nsis(appname, variant, version, files)
-
-		shutil.rmtree(self._package.abspath())
-
-	def _get_files(self):
-		'''returns a list of file names to be packaged from which the PREFIX
-		path has been stripped.		
-		'''
-		files = []
-		prefix = str(self.env.PREFIX)
-		i = prefix.find(':')
-		if i >= 0 and (i+1) < len(prefix):
-			prefix = prefix[i+1:]
-		i = len(self._package.relpath()) + len(prefix)
-
-		for f in self._package.ant_glob('**'):
-			files.append(str(f.relpath()[i:]).replace('\\','/'))
-		return files
-
-	def _package_ls(self, appname, variant, version, files):
-		'''just print all files that will be packaged.'''
-		p = Logs.info
-		p('')
-		p('=======================')
-		p('PACKAGE (ls)')
-		p('=======================')
-		for f in files:
-			p('$PREFIX%s' % f)
-		p('-----------------------')
-		
-	def _package_tar_bz2(self, appname, variant, version):
-		name = '%s-%s-%s' % (appname, variant, version)
-		p = Logs.info
-		p('')
-		p('=======================')
-		p('PACKAGE (tar.bz2)')
-		p('=======================')
-		p('PREFIX=%s' % self.env.PREFIX)	
-		ctx = Scripting.Dist()
-		ctx.arch_name = '%s.tar.bz2' % (name)
-		ctx.files = self._package.ant_glob('**')
-		ctx.tar_prefix = ''
-		ctx.base_path = self._package
-		ctx.archive()
-		p('-----------------------')
-
-	def _package_nsis(self, appname, variant, version, files):
-		nsis = self.env.NSIS
-		if isinstance(nsis, list):
-			if not len(nsis):
-				Logs.warn('NSIS not available, skipping')
-				return
-			nsis = nsis[0]
-		p = Logs.info
-		p('')
-		p('=======================')
-		p('PACKAGE (nsis)')
-		p('=======================')
-
-		# TODO:
-		# - use .nsi from command line or create .nsi script on the fly
-		# - copy .nsi to build dir
-		# - exec makensis
-		# what about defines?
-
-		if sys.platform == 'win32':
-			cmd = '%s /VERSION' % nsis
-		else:
-			cmd = '%s -VERSION' % nsis
-		stdout = self.cmd_and_log(cmd, output=Context.STDOUT, quiet=Context.STDOUT)
-		p('VERSION=%s' % stdout)
-		p('-----------------------')
-		
-
-	
-	
-	
-	
+#!/usr/bin/env python
+
+import shutil, os, sys, errno, tarfile, threading, time, gzip
+from waflib import Build, Context, Scripting, Logs, Utils, Errors
+
+
+def options(opt):
+    opt.add_option('--package_types', dest='package_types', default='all',
+                   action='store', help='package types to create; ls, tar.bz2, tar.gz, tar.xz, tar.zst, nsis or all (default=all)')
+    opt.add_option('--package_clean', dest='package_clean', default=False,
+                   action='store_true', help='remove the package staging directory before installing (default=False)')
+    opt.add_option('--package_staging', dest='package_staging', default='link',
+                   action='store', choices=['link', 'copy'],
+                   help='stage files using reflinks or hardlinks where possible, or always copy them (default=link)')
+    opt.add_option('--package_level', dest='package_level', default=None,
+                   action='store', type='int', help='compression level of tar.gz, tar.xz and tar.zst packages (default=compressor default)')
+    opt.add_option('--package_stream', dest='package_stream', default=False,
+                   action='store_true', help='add installed files directly to the tar packages, without using a package directory (default=False)')
+    opt.add_option('--package_reproducible', dest='package_reproducible', default=False,
+                   action='store_true', help='create reproducible tar packages; i.e. sorted entries and fixed owners, modes and times (default=False)')
+    opt.add_option('--package_cache', dest='package_cache', default='',
+                   action='store', help='directory in which reproducible tar packages will be cached (default=none)')
+
+
+def configure(conf):
+	conf.env.PACKAGE_TYPES = conf.options.package_types.split(',')
+
+	if conf.env.DEST_OS == 'win32':
+		try:
+			conf.find_program('makensis', var='NSIS')
+		except conf.errors.ConfigurationError:
+			conf.to_log('makensis was not found (ignoring)')
+
+	for (program, var) in (('pigz', 'PIGZ'), ('xz', 'XZ'), ('zstd', 'ZSTD')):
+		try:
+			conf.find_program(program, var=var)
+		except conf.errors.ConfigurationError:
+			conf.to_log('%s was not found (ignoring)' % program)
+
+
+def _stage_file(src, tgt, chmod, hardlink=True):
+	'''stages the file src as tgt without copying its contents where possible;
+	i.e. using a reflink (copy-on-write clone), a hardlink when the mode of the
+	file already is as requested (changing it would also change the build
+	output), or using copy_file_range/sendfile. Hardlinks will not be used
+	when tgt may be changed in place later on. Returns the method used.
+	'''
+	st = os.stat(src)
+	if hardlink and (st.st_mode & 0o7777) == chmod and _stage_hardlink(src, tgt, st):
+		return 'hardlink'
+	if _stage_reflink(src, tgt, st):
+		method = 'reflink'
+	else:
+		_stage_copy(src, tgt, st)
+		method = 'copy'
+	os.chmod(tgt, chmod)
+	os.utime(tgt, (st.st_atime, st.st_mtime))
+	return method
+
+
+def _stage_hardlink(src, tgt, st):
+	if not hasattr(os, 'link') or st.st_dev in STAGE_UNSUPPORTED['hardlink']:
+		return False
+	try:
+		os.link(src, tgt)
+	except OSError as e:
+		if e.errno in (errno.EXDEV, errno.EPERM):
+			STAGE_UNSUPPORTED['hardlink'].add(st.st_dev)
+		return False
+	return True
+
+
+def _stage_reflink(src, tgt, st):
+	if not sys.platform.startswith('linux') or st.st_dev in STAGE_UNSUPPORTED['reflink']:
+		return False
+	import fcntl
+	with open(src, 'rb') as fsrc:
+		with open(tgt, 'wb') as ftgt:
+			try:
+				fcntl.ioctl(ftgt.fileno(), FICLONE, fsrc.fileno())
+				return True
+			except (OSError, IOError):
+				STAGE_UNSUPPORTED['reflink'].add(st.st_dev)
+	os.remove(tgt)
+	return False
+
+
+def _stage_copy(src, tgt, st):
+	'''copies the contents within the kernel (i.e. copy_file_range or sendfile)
+	when available, using a regular copy otherwise.
+	'''
+	with open(src, 'rb') as fsrc:
+		with open(tgt, 'wb') as ftgt:
+			for name in ('copy_file_range', 'sendfile'):
+				fun = _stage_syscall(name)
+				if fun is None or name in STAGE_UNSUPPORTED:
+					continue
+				try:
+					if _stage_copy_kernel(name, fun, fsrc.fileno(), ftgt.fileno(), st.st_size):
+						return
+				except OSError as e:
+					if e.errno in STAGE_ERRNOS:
+						STAGE_UNSUPPORTED[name] = True
+					else:
+						raise
+				fsrc.seek(0)
+				ftgt.seek(0)
+				ftgt.truncate()
+			shutil.copyfileobj(fsrc, ftgt)
+
+
+def _stage_copy_kernel(name, fun, fdsrc, fdtgt, size):
+	'''returns False when the file could not be copied completely (e.g. when
+	the size of the file has been changed).
+	'''
+	offset = 0
+	while offset < size:
+		if name == 'copy_file_range':
+			n = fun(fdsrc, fdtgt, size - offset)
+		else:
+			n = fun(fdtgt, fdsrc, offset, size - offset)
+		if n == 0:
+			return False
+		offset += n
+	return True
+
+
+def _stage_syscall(name):
+	'''returns the function for an in-kernel copy (i.e. copy_file_range or
+	sendfile) having the signature of the one in the os module; python 2 does
+	not provide these, in which case the C library will be used (on Linux).
+	Returns None when not available.
+	'''
+	if name in STAGE_SYSCALLS:
+		return STAGE_SYSCALLS[name]
+	fun = getattr(os, name, None)
+	if fun is None and sys.platform.startswith('linux'):
+		try:
+			import ctypes
+			cfun = getattr(ctypes.CDLL(None, use_errno=True), name)
+		except (ImportError, OSError, AttributeError):
+			cfun = None
+		if cfun is not None:
+			cfun.restype = ctypes.c_ssize_t
+			if name == 'copy_file_range':
+				cfun.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint]
+				call = lambda fdsrc, fdtgt, count: cfun(fdsrc, None, fdtgt, None, count, 0)
+			else:
+				cfun.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_long), ctypes.c_size_t]
+				call = lambda fdtgt, fdsrc, offset, count: cfun(fdtgt, fdsrc, ctypes.byref(ctypes.c_long(offset)), count)
+
+			def fun(*k):
+				n = call(*k)
+				if n < 0:
+					e = ctypes.get_errno()
+					raise OSError(e, os.strerror(e))
+				return n
+	STAGE_SYSCALLS[name] = fun
+	return fun
+
+
+FICLONE = 0x40049409
+
+
+STAGE_ERRNOS = (errno.ENOSYS, errno.EINVAL, errno.EXDEV, getattr(errno, 'EOPNOTSUPP', errno.ENOSYS))
+
+
+STAGE_UNSUPPORTED = { 'hardlink': set(), 'reflink': set() }
+
+
+STAGE_SYSCALLS = {}
+
+
+XZ_BLOCK_SIZE = 24 * 1024 * 1024
+
+
+TAR_MODES = { 'tar.bz2': 'bz2', 'tar.gz': 'gz', 'tar.xz': 'xz' }
+
+
+def _tar_mtime():
+	'''returns the modification time of entries in reproducible packages.'''
+	try:
+		return int(os.environ.get('SOURCE_DATE_EPOCH', 0))
+	except ValueError:
+		return 0
+
+
+def _tar_mode(mode):
+	'''returns the normalized mode of a file in a reproducible package.'''
+	if mode & 0o111:
+		return 0o755
+	return 0o644
+
+
+class PackageContext(Build.InstallContext):
+	cmd = 'package'
+	fun = 'build'
+
+	def init_dirs(self, *k, **kw):
+		'''the package directory is kept between package runs, only files that
+		have been changed will be installed again (unless --package_clean).
+		when streaming (--package_stream) no package directory will be used.
+		'''
+		super(PackageContext, self).init_dirs(*k, **kw)
+		self._package = self.bldnode.make_node('.wafpackage')
+		self._installed = set()
+		self._stream = None
+		self._streamed = []
+		self._lock = threading.Lock()
+		if self.options.package_clean:
+			try:
+				shutil.rmtree(self._package.abspath())
+			except:
+				pass
+			if os.path.exists(self._package.abspath()):
+				self.fatal('Could not remove package directory %r' % self._package)
+		if not self.options.package_stream:
+			self._package.mkdir()
+		self.options.destdir = self._package.abspath()
+
+	def execute_build(self):
+		'''when streaming, opens the tar packages before the build is executed
+		such that installed files can be added while the build is running.
+		reproducible packages require sorted entries, hence those will be
+		created once the build has been finished.
+		'''
+		if not self.options.package_stream:
+			return super(PackageContext, self).execute_build()
+
+		if self.options.package_reproducible:
+			self._stream = []
+			super(PackageContext, self).execute_build()
+			self._package_tars(sorted(self._streamed, key=lambda e: e[0]))
+			return
+
+		self._stream = []
+		for ext in self._package_tar_types():
+			archive = self._package_tar_open(self._package_name(ext), ext)
+			if archive:
+				self._stream.append(archive)
+		try:
+			super(PackageContext, self).execute_build()
+		except:
+			for archive in self._stream:
+				self._package_tar_close(archive, False)
+			raise
+		for archive in self._stream:
+			self._package_tar_close(archive)
+
+	def do_install(self, src, tgt, chmod=Utils.O644):
+		'''installs the file into the package directory unless an identical
+		file (i.e. same size and modification time or contents) already exists.
+		'''
+		if self._stream is not None:
+			return self._package_stream(src, tgt, chmod)
+		self._installed.add(os.path.abspath(tgt))
+		try:
+			st1 = os.stat(tgt)
+			st2 = os.stat(src)
+		except OSError:
+			pass
+		else:
+			if st1.st_size == st2.st_size:
+				if int(st1.st_mtime) == int(st2.st_mtime) or Utils.h_file(src) == Utils.h_file(tgt):
+					if (st1.st_mode & 0o7777) == chmod:
+						return False
+					if (st1.st_dev, st1.st_ino) != (st2.st_dev, st2.st_ino):
+						os.chmod(tgt, chmod)
+						return False
+					# a hardlink to src; changing its mode would also change src
+		if self.options.package_staging == 'copy':
+			return super(PackageContext, self).do_install(src, tgt, chmod)
+
+		if not self.progress_bar:
+			Logs.info('+ install %s (from %s)' % (tgt, src.replace(self.srcnode.abspath() + os.sep, '')))
+		Utils.check_dir(os.path.dirname(tgt))
+		try:
+			os.remove(tgt)
+		except OSError:
+			pass
+		try:
+			method = _stage_file(src, tgt, chmod)
+		except (OSError, IOError):
+			try:
+				os.stat(src)
+			except (OSError, IOError):
+				Logs.error('File %r does not exist' % src)
+			raise Errors.WafError('Could not install the file %r' % tgt)
+		Logs.debug('package: staged %r using %s' % (tgt, method))
+		return True
+
+	def do_link(self, src, tgt):
+		if self._stream is not None:
+			return self._package_stream(src, tgt)
+		self._installed.add(os.path.abspath(tgt))
+		return super(PackageContext, self).do_link(src, tgt)
+
+	def _package_stream(self, src, tgt, chmod=None):
+		'''adds an installed file, or a symbolic link to src when no chmod has
+		been given, to all tar packages being streamed.
+		'''
+		arcname = os.path.relpath(tgt, self.options.destdir)
+		if not self.progress_bar:
+			if chmod is None:
+				Logs.info('+ symlink %s (to %s)' % (tgt, src))
+			else:
+				Logs.info('+ install %s (from %s)' % (tgt, src.replace(self.srcnode.abspath() + os.sep, '')))
+		entry = (arcname.replace('\\', '/'), src, chmod, chmod is None)
+		with self._lock:
+			self._streamed.append(entry)
+			try:
+				for archive in self._stream:
+					self._package_tar_entry(archive, entry)
+			except (OSError, IOError):
+				if chmod is not None and not os.path.exists(src):
+					Logs.error('File %r does not exist' % src)
+				raise Errors.WafError('Could not install the file %r' % tgt)
+		return True
+
+	def _remove_stale(self):
+		'''removes files from the package directory that have not been installed
+		by the current package run (e.g. files that have been removed from the 
+		project), including the resulting empty directories.
+		'''
+		top = self._package.abspath()
+		for root, dirs, files in os.walk(top, topdown=False):
+			for name in files:
+				path = os.path.join(root, name)
+				if path not in self._installed:
+					Logs.info('- remove %s' % path)
+					os.remove(path)
+			if root != top and not os.listdir(root):
+				os.rmdir(root)
+
+	def execute(self, *k, **kw):
+		'''executes normal 'install' into a special package directory and creates
+		a package (e.g. tar.bz2 or rpm) file containing all installed files into 
+		this package directory. The package directory will be kept, so the next
+		package run only has to install the files that have been changed.
+		'''		
+		super(PackageContext, self).execute(*k, **kw)
+
+		version = getattr(Context.g_module, Context.VERSION, self.top_dir)
+		appname = getattr(Context.g_module, Context.APPNAME, self.top_dir)
+		variant = self.variant if self.variant else ''
+		pkgtype = self.env.PACKAGE_TYPES
+
+		if self._stream is not None:
+			nodes = None
+			entries = sorted(self._streamed, key=lambda e: e[0])
+		else:
+			self._remove_stale()
+			nodes = self._package.ant_glob('**')
+			entries = sorted((n.path_from(self._package).replace('\\', '/'), n.abspath(), None, False) for n in nodes)
+		files = self._get_files([e[0] for e in entries])
+
+		if set(pkgtype) & set(['all', 'ls']):
+			self._package_ls(appname, variant, version, files)
+
+		if nodes is not None:
+			if self.options.package_reproducible:
+				self._package_tars(entries)
+			else:
+				if set(pkgtype) & set(['all', 'tar.bz2']):
+					self._package_tar_bz2(appname, variant, version, nodes)
+
+				for ext in ('tar.gz', 'tar.xz', 'tar.zst'):
+					if ext in pkgtype:
+						self._package_tar(self._package_name(ext), ext, entries)
+
+		if set(pkgtype) & set(['all', 'nsis']):
+			if self.env.DEST_OS == 'win32':
+				self._package_nsis(appname, variant, version, files)
+
+	def _package_name(self, ext):
+		version = getattr(Context.g_module, Context.VERSION, self.top_dir)
+		appname = getattr(Context.g_module, Context.APPNAME, self.top_dir)
+		variant = self.variant if self.variant else ''
+		return '%s-%s-%s.%s' % (appname, variant, version, ext)
+
+	def _package_tar_types(self):
+		'''returns the types of tar packages to be created.'''
+		pkgtype = self.env.PACKAGE_TYPES
+		types = [ext for ext in ('tar.gz', 'tar.xz', 'tar.zst') if ext in pkgtype]
+		if set(pkgtype) & set(['all', 'tar.bz2']):
+			types.insert(0, 'tar.bz2')
+		return types
+
+	def _get_files(self, names):
+		'''returns the list of file names (i.e. archive names, relative to the
+		package directory) to be packaged from which the PREFIX path has been
+		stripped.		
+		'''
+		prefix = str(self.env.PREFIX)
+		i = prefix.find(':')
+		if i >= 0 and (i+1) < len(prefix):
+			prefix = prefix[i+1:]
+		i = len(prefix)
+		return [str('/' + n)[i:] for n in names]
+
+	def _package_ls(self, appname, variant, version, files):
+		'''just print all files that will be packaged.'''
+		p = Logs.info
+		p('')
+		p('=======================')
+		p('PACKAGE (ls)')
+		p('=======================')
+		for f in files:
+			p('$PREFIX%s' % f)
+		p('-----------------------')
+		
+	def _package_tar_bz2(self, appname, variant, version, nodes):
+		name = '%s-%s-%s' % (appname, variant, version)
+		p = Logs.info
+		p('')
+		p('=======================')
+		p('PACKAGE (tar.bz2)')
+		p('=======================')
+		p('PREFIX=%s' % self.env.PREFIX)	
+		ctx = Scripting.Dist()
+		ctx.arch_name = '%s.tar.bz2' % (name)
+		ctx.files = nodes
+		ctx.tar_prefix = ''
+		ctx.base_path = self._package
+		try:
+			os.remove(ctx.arch_name) # see _package_tar_open
+		except OSError:
+			pass
+		ctx.archive()
+		p('-----------------------')
+
+	def _package_tars(self, entries):
+		'''creates all reproducible tar packages, unless an identical package
+		(i.e. one having the same manifest) exists in the package cache.
+		'''
+		manifest = self._package_manifest(entries)
+		for ext in self._package_tar_types():
+			self._package_tar(self._package_name(ext), ext, entries, manifest)
+
+	def _package_tar(self, name, ext, entries, manifest=None):
+		'''creates a compressed tar archive containing the entries; i.e. tuples
+		of the archive name, path, mode (chmod) and whether it is a link.
+		'''
+		if manifest is not None:
+			manifest = self._package_manifest_ext(manifest, ext)
+			if self._package_cache_get(name, ext, manifest):
+				return
+		archive = self._package_tar_open(name, ext)
+		if archive is None:
+			return
+		try:
+			for entry in entries:
+				self._package_tar_entry(archive, entry)
+		except:
+			self._package_tar_close(archive, False)
+			raise
+		self._package_tar_close(archive)
+		if manifest is not None:
+			self._package_cache_put(name, manifest)
+
+	def _package_manifest(self, entries):
+		'''returns the hash of the entries to be packaged; i.e. of their names,
+		(normalized) modes, link targets and contents.
+		'''
+		m = Utils.md5()
+		m.update(str(_tar_mtime()).encode())
+		for (arcname, path, chmod, link) in entries:
+			if not link and chmod is None and os.path.islink(path):
+				(path, link) = (os.readlink(path), True)
+			if link:
+				line = 'L %s %s' % (arcname, path)
+			else:
+				st = os.stat(path)
+				if chmod is None:
+					chmod = st.st_mode
+				line = 'F %s %o %i %s' % (arcname, _tar_mode(chmod), st.st_size, Utils.to_hex(Utils.h_file(path)))
+			m.update(('%s\n' % line).encode('utf-8'))
+		return m.hexdigest()
+
+	def _package_manifest_ext(self, manifest, ext):
+		'''returns the manifest of a package type; i.e. including the
+		compressor and compression level being used.
+		'''
+		cmd = self._package_compressor(ext, self.options.package_level)
+		compressor = os.path.basename(cmd[0]) if cmd else 'tarfile'
+		m = Utils.md5()
+		m.update(('%s %s %s %s' % (manifest, ext, compressor, self.options.package_level)).encode())
+		return m.hexdigest()
+
+	def _package_cache_get(self, name, ext, manifest):
+		'''takes the package from the package cache; returns False when no
+		identical package has been cached.
+		'''
+		cache = self.options.package_cache
+		if not cache:
+			return False
+		path = os.path.join(os.path.abspath(os.path.expanduser(cache)), manifest, name)
+		if not os.path.isfile(path):
+			return False
+		try:
+			os.remove(name)
+		except OSError:
+			pass
+		try:
+			_stage_file(path, name, Utils.O644, hardlink=False)
+		except (OSError, IOError):
+			Logs.warn('Could not take %r from the package cache' % path)
+			return False
+
+		p = Logs.info
+		p('')
+		p('=======================')
+		p('PACKAGE (%s)' % ext)
+		p('=======================')
+		p('MANIFEST=%s' % manifest)
+		p('Package taken from cache: %s' % name)
+		p('-----------------------')
+		return True
+
+	def _package_cache_put(self, name, manifest):
+		'''stores the package in the package cache.'''
+		cache = self.options.package_cache
+		if not cache or not os.path.exists(name):
+			return
+		path = os.path.join(os.path.abspath(os.path.expanduser(cache)), manifest, name)
+		tmp = '%s.%i.tmp' % (path, os.getpid())
+		try:
+			Utils.check_dir(os.path.dirname(path))
+			_stage_file(name, tmp, Utils.O644, hardlink=False)
+			if os.path.exists(path):
+				os.remove(path)
+			os.rename(tmp, path)
+		except (OSError, IOError, Errors.WafError):
+			Logs.warn('Could not store %r in the package cache' % name)
+		else:
+			Logs.info('MANIFEST=%s' % manifest)
+
+	def _package_tar_open(self, name, ext):
+		'''opens a tar archive which will be compressed using a multi-threaded
+		compressor (i.e. pigz, xz or zstd) when available; returns None when the
+		archive type is not supported.
+		'''
+		level = self.options.package_level
+		cmd = self._package_compressor(ext, level)
+		mode = TAR_MODES.get(ext)
+		if not cmd and (not mode or (mode == 'xz' and sys.version_info[0] < 3)):
+			Logs.warn('%s compressor not available, skipping' % ext)
+			return None
+
+		# replace, rather than overwrite, an existing archive; other files
+		# (e.g. in the package cache) may share its inode
+		try:
+			os.remove(name)
+		except OSError:
+			pass
+
+		archive = { 'name': name, 'ext': ext, 'cmd': cmd, 'proc': None, 'gzip': None }
+		archive['file'] = open(name, 'wb')
+		if cmd:
+			archive['proc'] = Utils.subprocess.Popen(cmd, stdin=Utils.subprocess.PIPE, stdout=archive['file'])
+			archive['tar'] = tarfile.open(fileobj=archive['proc'].stdin, mode='w|', format=tarfile.PAX_FORMAT)
+		elif mode == 'gz' and self.options.package_reproducible:
+			# the gzip header contains a time stamp unless given explicitly
+			archive['gzip'] = gzip.GzipFile(filename='', mode='wb', fileobj=archive['file'], mtime=0,
+				compresslevel=9 if level is None else level)
+			archive['tar'] = tarfile.open(fileobj=archive['gzip'], mode='w|', format=tarfile.PAX_FORMAT)
+		else:
+			kw = {}
+			if level is not None:
+				kw['preset' if mode == 'xz' else 'compresslevel'] = level
+			archive['tar'] = tarfile.open(fileobj=archive['file'], mode='w:%s' % mode, format=tarfile.PAX_FORMAT, **kw)
+		return archive
+
+	def _package_tar_close(self, archive, success=True):
+		'''closes the tar archive; removes it when it could not be completed.'''
+		(name, proc) = (archive['name'], archive['proc'])
+		try:
+			archive['tar'].close()
+			if archive['gzip']:
+				archive['gzip'].close()
+		finally:
+			if proc:
+				proc.stdin.close()
+				ret = proc.wait()
+			archive['file'].close()
+		if proc and ret:
+			success = False
+		if not success:
+			os.remove(name)
+			if proc and ret:
+				self.fatal('Could not create %r (%r returned %r)' % (name, archive['cmd'][0], ret))
+			return
+
+		p = Logs.info
+		p('')
+		p('=======================')
+		p('PACKAGE (%s)' % archive['ext'])
+		p('=======================')
+		p('PREFIX=%s' % self.env.PREFIX)
+		if proc:
+			p('COMPRESSOR=%s' % ' '.join(archive['cmd']))
+		p('New archive created: %s' % name)
+		p('-----------------------')
+
+	def _package_compressor(self, ext, level):
+		'''returns the command of the multi-threaded compressor to be used for
+		the given archive type, or None when it is not available.
+		'''
+		jobs = str(self.jobs)
+		if ext == 'tar.gz' and self.env.PIGZ:
+			cmd = [self.env.PIGZ, '-c', '-n', '-p', jobs]
+		elif ext == 'tar.xz' and self.env.XZ:
+			if self.options.package_reproducible:
+				# xz uses a different (single threaded) encoder when using one
+				# thread; fixed blocks give the same output for any number of
+				# threads
+				cmd = [self.env.XZ, '-c', '-T', str(max(2, self.jobs)), '--block-size=%i' % XZ_BLOCK_SIZE]
+			else:
+				cmd = [self.env.XZ, '-c', '-T', jobs]
+		elif ext == 'tar.zst' and self.env.ZSTD:
+			cmd = [self.env.ZSTD, '-c', '-q', '-T%s' % jobs]
+			if level is not None and level > 19:
+				cmd.append('--ultra')
+		else:
+			return None
+		if isinstance(cmd[0], list):
+			cmd = cmd[0] + cmd[1:]
+		if level is not None:
+			cmd.append('-%i' % level)
+		return cmd
+
+	def _package_tar_entry(self, archive, entry):
+		(arcname, path, chmod, link) = entry
+		if link:
+			self._package_tar_link(archive, path, arcname)
+		else:
+			self._package_tar_add(archive, path, arcname, chmod)
+
+	def _package_tar_add(self, archive, path, arcname, chmod=None):
+		'''adds a file to the archive; symbolic links will be added as is unless
+		a mode (chmod) has been given, as is the case for installed files.
+		'''
+		tar = archive['tar']
+		if chmod is None and os.path.islink(path):
+			tar.addfile(self._package_tarinfo(tar.gettarinfo(name=path, arcname=arcname)))
+			return
+		with open(path, 'rb') as f:
+			if self.options.package_reproducible:
+				# always a regular file; gettarinfo adds files sharing an inode
+				# (e.g. staged hardlinks) as links, depending on the staging
+				st = os.fstat(f.fileno())
+				tinfo = tarfile.TarInfo(arcname)
+				tinfo.type = tarfile.REGTYPE
+				tinfo.size = st.st_size
+				tinfo.mode = st.st_mode & 0o7777
+			else:
+				tinfo = tar.gettarinfo(arcname=arcname, fileobj=f)
+			if chmod is not None:
+				tinfo.mode = chmod
+			tar.addfile(self._package_tarinfo(tinfo), f)
+
+	def _package_tar_link(self, archive, src, arcname):
+		'''adds a symbolic link, pointing to src, to the archive.'''
+		tinfo = tarfile.TarInfo(arcname)
+		tinfo.type = tarfile.SYMTYPE
+		tinfo.linkname = src
+		tinfo.mode = 0o777
+		tinfo.mtime = int(time.time())
+		archive['tar'].addfile(self._package_tarinfo(tinfo))
+
+	def _package_tarinfo(self, tinfo):
+		'''sets the owner of an archive entry to root; for reproducible packages
+		also normalizes its mode and modification time.
+		'''
+		tinfo.uid = 0
+		tinfo.gid = 0
+		tinfo.uname = 'root'
+		tinfo.gname = 'root'
+		if self.options.package_reproducible:
+			tinfo.mtime = _tar_mtime()
+			if not tinfo.issym():
+				tinfo.mode = _tar_mode(tinfo.mode)
+		return tinfo
+
+	def _package_nsis(self, appname, variant, version, files):
+		nsis = self.env.NSIS
+		if isinstance(nsis, list):
+			if not len(nsis):
+				Logs.warn('NSIS not available, skipping')
+				return
+			nsis = nsis[0]
+		p = Logs.info
+		p('')
+		p('=======================')
+		p('PACKAGE (nsis)')
+		p('=======================')
+
+		# TODO:
+		# - use .nsi from command line or create .nsi script on the fly
+		# - copy .nsi to build dir
+		# - exec makensis
+		# what about defines?
+
+		if sys.platform == 'win32':
+			cmd = '%s /VERSION' % nsis
+		else:
+			cmd = '%s -VERSION' % nsis
+		stdout = self.cmd_and_log(cmd, output=Context.STDOUT, quiet=Context.STDOUT)
+		p('VERSION=%s' % stdout)
+		p('-----------------------')
+		
+
+	
+	
+	
+	